@@ -1,14 +1,14 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain.tools import Tool
 
-from app.data.catalog import load_cars_with_meta
+from app.data.catalog import get_catalog
 from app.models import CarRecommendationRequest
 from app.recommendations import build_recommendations
-from app.services.nhtsa_issues import get_complaints_and_recalls
+from app.services.nhtsa_issues import get_complaints_and_recalls, get_complaints_and_recalls_async
 
 
 DEFAULT_REQUEST: Dict[str, Any] = {
@@ -45,10 +45,9 @@ def search_cars_by_criteria(input_str: str) -> str:
 
 def get_car_details(input_str: str) -> str:
     car_id = (input_str or "").strip()
-    catalog, _, _ = load_cars_with_meta()
-    for car in catalog:
-        if car.get("id") == car_id:
-            return json.dumps(car, ensure_ascii=True)
+    car = get_catalog().get_car(car_id)
+    if car is not None:
+        return json.dumps(car, ensure_ascii=True)
     return json.dumps({"error": "car_not_found", "car_id": car_id}, ensure_ascii=True)
 
 
@@ -57,23 +56,37 @@ def compare_cars(input_str: str) -> str:
     ids = payload.get("ids", []) if isinstance(payload, dict) else []
     if not isinstance(ids, list):
         return json.dumps({"error": "ids_must_be_list"}, ensure_ascii=True)
-    catalog, _, _ = load_cars_with_meta()
-    matches = [car for car in catalog if car.get("id") in ids]
+    matches = get_catalog().get_cars(ids)
     return json.dumps({"matches": matches}, ensure_ascii=True)
 
 
-def get_safety_info(input_str: str) -> str:
+def _parse_safety_payload(input_str: str) -> Tuple[Optional[Tuple[int, str, str]], Optional[str]]:
     payload = _parse_json_payload(input_str)
     make = payload.get("make")
     model = payload.get("model")
     year = payload.get("year")
     if not make or not model or not year:
-        return json.dumps({"error": "make_model_year_required"}, ensure_ascii=True)
+        return None, json.dumps({"error": "make_model_year_required"}, ensure_ascii=True)
     try:
         year_int = int(year)
     except (TypeError, ValueError):
-        return json.dumps({"error": "invalid_year"}, ensure_ascii=True)
-    data = get_complaints_and_recalls(year_int, make, model)
+        return None, json.dumps({"error": "invalid_year"}, ensure_ascii=True)
+    return (year_int, make, model), None
+
+
+def get_safety_info(input_str: str) -> str:
+    args, error = _parse_safety_payload(input_str)
+    if error:
+        return error
+    data = get_complaints_and_recalls(*args)
+    return json.dumps(data, ensure_ascii=True)
+
+
+async def get_safety_info_async(input_str: str) -> str:
+    args, error = _parse_safety_payload(input_str)
+    if error:
+        return error
+    data = await get_complaints_and_recalls_async(*args)
     return json.dumps(data, ensure_ascii=True)
 
 
@@ -97,6 +110,7 @@ def build_tools() -> List[Tool]:
         Tool(
             name="get_safety_info",
             func=get_safety_info,
+            coroutine=get_safety_info_async,
             description="Get NHTSA complaints and recalls (JSON: {\"make\": \"Toyota\", \"model\": \"Camry\", \"year\": 2019}).",
         ),
     ]
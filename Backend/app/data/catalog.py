@@ -1,7 +1,28 @@
 from pathlib import Path
 import json
-from typing import List, Dict, Any, Tuple, Optional
+import os
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Iterator, Sequence, Tuple, Optional
 from datetime import datetime
+from threading import Lock, get_ident
+
+from app.data.columns import CatalogColumns
+from app.data.merge import merge_catalogs
+from app.data.snapshot import (
+    SnapshotReader,
+    SnapshotRecords,
+    SnapshotWriter,
+    open_current_snapshot,
+    open_snapshot,
+    snapshot_path_for,
+    snapshot_paths_for,
+)
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
 
 # Fallback sample data so the app works even without a cached catalog
 MOCK_CARS: List[Dict[str, Any]] = [
@@ -70,51 +91,487 @@ MOCK_CARS: List[Dict[str, Any]] = [
 DATA_DIR = Path(__file__).resolve().parent
 CACHE_FILE = DATA_DIR / "cache" / "vehicles.json"
 KAGGLE_CACHE_FILE = DATA_DIR / "cache" / "kaggle_vehicles.json"
-CACHE_FILES = (KAGGLE_CACHE_FILE, CACHE_FILE)
+# NHTSA results by make/model/year, written by scripts/enrich_nhtsa.py
+NHTSA_SOURCE_FILE = DATA_DIR / "cache" / "nhtsa_vehicles.json"
+# Catalog sources by name, in merge order; see app.data.merge for the field precedence
+CACHE_SOURCES = (("kaggle", KAGGLE_CACHE_FILE), ("api", CACHE_FILE), ("nhtsa", NHTSA_SOURCE_FILE))
+# Sources that only fill in fields of vehicles the other sources list
+SUPPLEMENT_SOURCES = ("nhtsa",)
+CACHE_FILES = tuple(cache_file for _, cache_file in CACHE_SOURCES)
+# The sources merged into one catalog, republished with each of them; the loader maps it
+MERGED_CATALOG_FILE = DATA_DIR / "cache" / "merged_vehicles.json"
+# Bumped by every catalog publish; readers reload when it changes
+GENERATION_FILE_NAME = "catalog.generation"
+GENERATION_FILE = DATA_DIR / "cache" / GENERATION_FILE_NAME
+# How long a publisher retries replacing a file that a reader has open on Windows
+REPLACE_RETRY_SECONDS = 5.0
+
+DEFAULT_SAFETY_SCORE = 0.5  # Neutral safety score for cars without NHTSA data
 
 
-def _read_cache() -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+class CatalogSnapshot:
     """
-    Return data, using_mock flag, and last_updated timestamp (ISO) if cache exists.
+    One fully loaded version of the catalog.
+
+    Snapshots are shared by every request in the process, so callers must treat
+    `cars` and the records inside it as read-only. When the catalog comes from a
+    binary snapshot, `cars` is a SnapshotRecords sequence that decodes rows on access.
+    `columns` is the column-oriented view of the same rows used by the vectorized
+    scorer; the id index and the deduplicated (make, model, year) list served by
+    /models are built once per snapshot as well.
     """
-    for cache_file in CACHE_FILES:
-        if cache_file.exists():
+
+    def __init__(
+        self,
+        cars: Sequence[Dict[str, Any]],
+        using_mock: bool,
+        last_updated: Optional[str],
+        generation: int,
+        signature: Tuple[Any, ...],
+        published_generation: Optional[int] = None,
+    ) -> None:
+        self.cars = cars
+        self.using_mock = using_mock
+        self.last_updated = last_updated
+        self.generation = generation
+        self.signature = signature
+        self.published_generation = published_generation
+        if isinstance(cars, SnapshotRecords):
+            self.columns = CatalogColumns.from_snapshot(cars)
+            ids, makes, models, years = (cars.reader.column_values(name) for name in ("id", "make", "model", "year"))
+        else:
+            self.columns = CatalogColumns.from_records(cars)
+            ids, makes, models, years = (
+                [car.get(name) for car in cars] for name in ("id", "make", "model", "year")
+            )
+        self.by_id: Dict[Any, List[int]] = {}
+        unique_models: Dict[str, Dict[str, Any]] = {}
+        for row, (car_id, make, model, year) in enumerate(zip(ids, makes, models, years)):
+            self.by_id.setdefault(car_id, []).append(row)
+            if make and model and year:
+                unique_models[f"{make}_{model}_{year}"] = {"make": make, "model": model, "year": year}
+        self.models = list(unique_models.values())
+
+    def get_car(self, car_id: Any) -> Optional[Dict[str, Any]]:
+        """Return the first car with this id, or None."""
+        try:
+            rows = self.by_id.get(car_id)
+        except TypeError:
+            return None
+        return self.cars[rows[0]] if rows else None
+
+    def get_cars(self, car_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Return every car whose id is in `car_ids`, in catalog order."""
+        rows = set()
+        for car_id in car_ids:
             try:
-                with cache_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f)
-                if isinstance(data, list) and data:
-                    ts = datetime.fromtimestamp(cache_file.stat().st_mtime).isoformat()
-                    return data, False, ts
-            except (OSError, json.JSONDecodeError):
+                rows.update(self.by_id.get(car_id, ()))
+            except TypeError:
                 continue
-    return MOCK_CARS, True, None
+        return [self.cars[row] for row in sorted(rows)]
+
+
+_CATALOG_LOCK = Lock()
+_CURRENT: Optional[CatalogSnapshot] = None
+# Signature of files that failed to load, so they are not re-read on every request
+_FAILED_SIGNATURE: Optional[Tuple[Any, ...]] = None
+_LOAD_ERROR: Optional[str] = None
+
+
+class CatalogLoadError(Exception):
+    """Raised when a cache file exists but cannot be read."""
+
 
+def generation_path_for(catalog_path: Path) -> Path:
+    return catalog_path.parent / GENERATION_FILE_NAME
 
-def load_cars() -> List[Dict[str, Any]]:
+
+def read_generation(path: Optional[Path] = None) -> Optional[int]:
+    """The last published catalog generation, or None if nothing was published yet."""
+    try:
+        with (path or GENERATION_FILE).open("r", encoding="utf-8") as f:
+            return int(json.load(f)["generation"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+@contextmanager
+def _generation_lock(path: Path) -> Iterator[None]:
     """
-    Load cars from the cached catalog file if present; otherwise fall back to MOCK_CARS.
-    Ensures all cars have safety_score field (defaults to 0.5 if missing).
+    Serialize publishers across processes and threads with an OS lock on a lock file.
+
+    The OS drops the lock when its holder exits, so a publisher that dies mid-publish
+    never leaves a lock behind that others would have to break. The lock file itself
+    stays in place; removing it would let two publishers lock different files.
     """
-    data, _, _ = _read_cache()
-    
-    # Ensure all cars have safety_score
+    lock_path = path.with_name(f"{path.name}.lock")
+    with lock_path.open("a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    # Retries for about ten seconds before giving up
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _replace(tmp_path: Path, final_path: Path) -> None:
+    """
+    os.replace, retried for a while on PermissionError: Windows refuses to replace a
+    file that another process has open, which readers only do for a moment.
+    """
+    deadline = time.monotonic() + REPLACE_RETRY_SECONDS
+    while True:
+        try:
+            os.replace(tmp_path, final_path)
+            return
+        except PermissionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _publish(writers: Sequence["CatalogWriter"]) -> int:
+    """
+    Move finished catalogs and their snapshots into place as the next generation and
+    record it. The caller holds the generation lock, so generations are numbered in the
+    order their files appeared and readers that wait for the bump see complete files.
+
+    Each snapshot gets the generation's own file name and goes before its JSON: next to
+    the old JSON it does not match and is ignored. Older snapshots of the file are
+    removed afterwards; one that a reader still has mapped on Windows cannot be, and is
+    tried again by the next publish.
+    """
+    generation_path = generation_path_for(writers[0].path)
+    generation = (read_generation(generation_path) or 0) + 1
+    for writer in writers:
+        os.replace(writer._snapshot_tmp, snapshot_path_for(writer.path, generation))
+        _replace(writer._tmp_path, writer.path)
+    entry = {"generation": generation, "file": writers[0].path.name, "published_at": datetime.now().isoformat()}
+    tmp_path = generation_path.with_name(f"{generation_path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    _replace(tmp_path, generation_path)
+    for writer in writers:
+        current = snapshot_path_for(writer.path, generation)
+        for old_path in snapshot_paths_for(writer.path):
+            if old_path != current:
+                try:
+                    old_path.unlink()
+                except OSError:
+                    pass
+    return generation
+
+
+def _file_stamp(path: Path) -> Optional[List[int]]:
+    """Size and mtime of a file, as the merged catalog records its sources; None if missing."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _merged_catalog_writer(replacing: Optional["CatalogWriter"] = None) -> Optional["CatalogWriter"]:
+    """
+    A finished but unpublished CatalogWriter holding the merge of the cache sources, or
+    None when fewer than two of them have vehicles. `replacing` is the finished writer
+    of a source about to be published; its temporary files stand in for the source.
+
+    The snapshot's metadata records the size and mtime of every source file the merge
+    was built from, so the loader can tell whether it is still current.
+    """
+    sources = []
+    stamps: Dict[str, List[int]] = {}
+    for name, cache_file in CACHE_SOURCES:
+        if replacing is not None and cache_file == replacing.path:
+            # The rename keeps the temporary file's size and mtime
+            stamp = _file_stamp(replacing._tmp_path)
+            reader = open_snapshot(replacing._snapshot_tmp)
+            cars = _snapshot_records(reader) if reader is not None and reader.rows else None
+        else:
+            # Stamped before reading: a file replaced meanwhile makes the merge look stale
+            stamp = _file_stamp(cache_file)
+            cars = _read_source(cache_file, skip_broken=True)
+        if stamp is not None:
+            stamps[name] = stamp
+        if cars:
+            sources.append((name, cars))
+    if len(sources) < 2 or all(name in SUPPLEMENT_SOURCES for name, _ in sources):
+        return None
+    merged = merge_catalogs(sources, supplements=SUPPLEMENT_SOURCES)
+    _ensure_safety_scores(merged)
+    writer = CatalogWriter(MERGED_CATALOG_FILE, metadata={"sources": stamps})
+    try:
+        writer.append(merged)
+    except BaseException:
+        writer.abort()
+        raise
+    writer._finish()
+    return writer
+
+
+def publish_merged_catalog() -> Optional[int]:
+    """
+    Merge the cache sources as they are on disk and publish the result; return its
+    generation, or None when there is nothing to merge.
+    """
+    with _generation_lock(generation_path_for(MERGED_CATALOG_FILE)):
+        writer = _merged_catalog_writer()
+        if writer is None:
+            return None
+        try:
+            return _publish([writer])
+        finally:
+            writer._discard()
+
+
+def _cache_signature() -> Tuple[Any, ...]:
+    """
+    Cheap fingerprint used to detect changes: the published generation (None if nothing
+    was published through CatalogWriter yet) followed by the mtime and size of the cache
+    files, so files copied or checked out by hand are picked up too. Snapshots are only
+    used while they match their JSON, so a change to them alone changes nothing.
+    """
+    signature: List[Any] = [read_generation()]
+    for cache_file in CACHE_FILES + (MERGED_CATALOG_FILE,):
+        try:
+            stat = cache_file.stat()
+        except OSError:
+            signature.append(None)
+            continue
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _snapshot_records(reader: SnapshotReader) -> SnapshotRecords:
+    return SnapshotRecords(reader, defaults={"safety_score": DEFAULT_SAFETY_SCORE})
+
+
+def _read_source(cache_file: Path, skip_broken: bool) -> Optional[Sequence[Dict[str, Any]]]:
+    """
+    The vehicles of one cache file, from its memory-mapped snapshot if it is current and
+    from its JSON otherwise; None if it has none. A file that cannot be parsed raises
+    CatalogLoadError unless `skip_broken`.
+    """
+    reader = open_current_snapshot(cache_file)
+    if reader is not None and reader.rows:
+        return _snapshot_records(reader)
+    if not cache_file.exists():
+        return None
+    try:
+        with cache_file.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        if not skip_broken:
+            raise CatalogLoadError(f"{cache_file.name}: {e}") from e
+        return None
+    return data if isinstance(data, list) and data else None
+
+
+def _read_cache(skip_broken: bool = False) -> Tuple[Sequence[Dict[str, Any]], bool, Optional[str]]:
+    """
+    Return data, using_mock flag, and last_updated timestamp (ISO) of the newest cache file.
+    When several cache files have vehicles, the merged catalog published with them is
+    memory-mapped; a single one is used as it is. Supplement sources alone do not make
+    a catalog.
+    """
+    stamps = {}
+    for name, cache_file in CACHE_SOURCES:
+        stamp = _file_stamp(cache_file)
+        if stamp is not None:
+            stamps[name] = stamp
+    reader = open_current_snapshot(MERGED_CATALOG_FILE)
+    if reader is not None and reader.rows and reader.header.get("metadata", {}).get("sources") == stamps:
+        ts = datetime.fromtimestamp(max(mtime_ns for _, mtime_ns in stamps.values()) / 1e9).isoformat()
+        return _snapshot_records(reader), False, ts
+
+    sources = []
+    updated = []
+    for name, cache_file in CACHE_SOURCES:
+        cars = _read_source(cache_file, skip_broken)
+        if cars:
+            sources.append((name, cars))
+            updated.append(cache_file.stat().st_mtime)
+    if all(name in SUPPLEMENT_SOURCES for name, _ in sources):
+        return MOCK_CARS, True, None
+    ts = datetime.fromtimestamp(max(updated)).isoformat()
+    if len(sources) == 1:
+        return sources[0][1], False, ts
+    # The sources changed since the last merge was published, e.g. a file was copied in
+    # by hand: merge them here until scripts/merge_catalog.py publishes the merge
+    return merge_catalogs(sources, supplements=SUPPLEMENT_SOURCES), False, ts
+
+
+def _ensure_safety_scores(data: List[Dict[str, Any]]) -> None:
     for car in data:
         if "safety_score" not in car:
-            car["safety_score"] = 0.5  # Default neutral safety score
-    
-    return data
+            car["safety_score"] = DEFAULT_SAFETY_SCORE
+
+
+def get_catalog() -> CatalogSnapshot:
+    """
+    Return the process-wide catalog snapshot, reloading it only when a new generation
+    was published or a cache file changed on disk.
+
+    The check reads one small file and stats the cache files. A new snapshot is fully loaded and indexed before it
+    replaces the old one in a single assignment; until then, and while another thread is
+    loading it, callers keep getting the previous snapshot. Requests hold on to the
+    snapshot they started with, so each finishes on one generation. If the new files
+    cannot be read the previous snapshot stays in use; only the very first load goes
+    ahead without the unreadable file (or with the mock data).
+    """
+    global _CURRENT, _FAILED_SIGNATURE, _LOAD_ERROR
+
+    signature = _cache_signature()
+    current = _CURRENT
+    if current is not None and signature in (current.signature, _FAILED_SIGNATURE):
+        return current
+
+    if not _CATALOG_LOCK.acquire(blocking=current is None):
+        return current
+    try:
+        current = _CURRENT
+        if current is not None and signature in (current.signature, _FAILED_SIGNATURE):
+            return current
+        try:
+            data, using_mock, last_updated = _read_cache(skip_broken=current is None)
+        except CatalogLoadError as e:
+            _FAILED_SIGNATURE = signature
+            _LOAD_ERROR = str(e)
+            return current
+        if isinstance(data, list):
+            _ensure_safety_scores(data)
+        generation = current.generation + 1 if current is not None else 1
+        _CURRENT = CatalogSnapshot(data, using_mock, last_updated, generation, signature, signature[0])
+        _FAILED_SIGNATURE = None
+        _LOAD_ERROR = None
+        return _CURRENT
+    finally:
+        _CATALOG_LOCK.release()
+
+
+def catalog_load_error() -> Optional[str]:
+    """Why the latest published catalog could not be loaded, while the previous one is served."""
+    return _LOAD_ERROR
+
+
+def load_cars() -> Sequence[Dict[str, Any]]:
+    """
+    Load cars from the cached catalog file if present; otherwise fall back to MOCK_CARS.
+    Ensures all cars have safety_score field (defaults to 0.5 if missing).
+    """
+    return get_catalog().cars
 
 
-def load_cars_with_meta() -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+def load_cars_with_meta() -> Tuple[Sequence[Dict[str, Any]], bool, Optional[str]]:
     """
     Return cars, a flag indicating if mock data was used, and last_updated timestamp.
     Ensures all cars have safety_score field (defaults to 0.5 if missing).
     """
-    data, using_mock, last_updated = _read_cache()
-    
-    # Ensure all cars have safety_score
-    for car in data:
-        if "safety_score" not in car:
-            car["safety_score"] = 0.5  # Default neutral safety score
-    
-    return data, using_mock, last_updated
+    snapshot = get_catalog()
+    return snapshot.cars, snapshot.using_mock, snapshot.last_updated
+
+
+class CatalogWriter:
+    """
+    Write a catalog in batches: the JSON file, byte for byte what
+    `json.dump(cars, f, indent=2)` would write, plus its binary snapshot.
+
+    Only the current batch is held in memory, so catalogs of any size can be written
+    as they are built. Both files are written under temporary names and only renamed
+    into place by `close()`, which then bumps the catalog generation; readers never see
+    a partly written catalog. Closing one of the cache sources also merges the sources
+    and publishes the merged catalog in the same generation. Use as a context manager;
+    an exception aborts the write. `metadata` goes into the snapshot's header.
+    """
+
+    def __init__(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None) -> None:
+        self.path = output_path
+        self.rows = 0
+        self.generation: Optional[int] = None
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.{get_ident()}.tmp")
+        self._file = self._tmp_path.open("w", encoding="utf-8")
+        # Only places the temporary files; the snapshot is published under its generation's name
+        self._snapshot = SnapshotWriter(snapshot_path_for(output_path))
+        self._snapshot_tmp: Optional[Path] = None
+        self._metadata = metadata
+
+    def append(self, cars: List[Dict[str, Any]]) -> None:
+        if cars:
+            # Render the batch as a list and drop its brackets, so records keep the
+            # nesting level they have in the whole file
+            self._file.write(("[\n" if self.rows == 0 else ",\n") + json.dumps(cars, indent=2)[2:-2])
+            self.rows += len(cars)
+        self._snapshot.append(cars)
+
+    def _finish(self) -> None:
+        """Complete both temporary files, ready for `_publish`."""
+        try:
+            self._file.write("\n]" if self.rows else "[]")
+            self._file.close()
+            # A rename keeps the file's size and mtime, which the snapshot records
+            self._snapshot_tmp = self._snapshot.assemble(
+                source=self._tmp_path, source_name=self.path.name, metadata=self._metadata
+            )
+        except BaseException:
+            self.abort()
+            raise
+
+    def _discard(self) -> None:
+        """Remove whatever temporary files a publish left behind."""
+        if self._snapshot_tmp is not None:
+            self._snapshot_tmp.unlink(missing_ok=True)
+        self._tmp_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self._finish()
+        writers = [self]
+        try:
+            with _generation_lock(generation_path_for(self.path)):
+                if self.path in CACHE_FILES:
+                    # Under the lock, so the merge includes every source published before it
+                    merged = _merged_catalog_writer(replacing=self)
+                    if merged is not None:
+                        writers.append(merged)
+                self.generation = _publish(writers)
+        finally:
+            for writer in writers:
+                writer._discard()
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+        self._snapshot.abort()
+
+    def __enter__(self) -> "CatalogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def save_catalog(cars: List[Dict[str, Any]], output_path: Path) -> Optional[int]:
+    """
+    Publish a catalog as JSON plus its binary snapshot, which the loader memory-maps,
+    and return its generation.
+    """
+    with CatalogWriter(output_path) as writer:
+        writer.append(cars)
+    return writer.generation
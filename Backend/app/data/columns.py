@@ -0,0 +1,289 @@
+"""Column-oriented view of the catalog used by the vectorized scoring engine."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.data.snapshot import ABSENT, ENCODED, INT_VALUE, VALUE, SnapshotRecords
+from app.recommender import (
+    acceleration_feature_batch,
+    fuel_feature_batch,
+    mpg_to_l_per_100km_batch,
+    ownership_cost_feature_batch,
+    reliability_feature_batch,
+    safety_feature_batch,
+    winter_feature_batch,
+)
+
+
+NUMERIC_COLUMNS = (
+    "price",
+    "seats",
+    "l_per_100km",
+    "mpg",
+    "zero_to_sixty",
+    "annual_cost",
+    "reliability_score",
+    "safety_score",
+)
+CATEGORICAL_COLUMNS = ("drivetrain", "fuel_type")
+
+# Weight keys of the request-independent features, in the column order of `features`.
+# price_fit is the only component that depends on the request (its budget).
+FEATURE_NAMES = (
+    "winter_driving",
+    "fuel_efficiency",
+    "acceleration",
+    "ownership_cost",
+    "reliability",
+    "safety",
+)
+
+# build_recommendations reads these fields with car.get(name, 0.0), so a missing key
+# scores as 0.0 while an explicit null takes the feature's None default.
+ABSENT_AS_ZERO = ("price", "zero_to_sixty", "annual_cost", "reliability_score", "safety_score")
+
+
+def _as_float(value: Any) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _floats(values: Sequence[Any]) -> np.ndarray:
+    return np.fromiter((_as_float(value) for value in values), dtype=np.float64, count=len(values))
+
+
+def _encode_categories(values: Sequence[Any]) -> Tuple[np.ndarray, List[Hashable]]:
+    """Integer codes (-1 for None) and the distinct values in order of first appearance."""
+    lookup: Dict[Hashable, int] = {}
+    column_codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            column_codes[i] = -1
+            continue
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(lookup)
+        column_codes[i] = code
+    return column_codes, list(lookup)
+
+
+class CatalogColumns:
+    """
+    Float arrays for the numeric fields and integer codes for the categorical ones.
+
+    Row `i` of every array describes `records[i]`. Missing values are NaN in numeric
+    columns and -1 in categorical codes; `absent[name]` additionally marks rows whose
+    record does not have the key at all, since the scalar scorer treats a missing key
+    and an explicit null differently for some fields.
+    """
+
+    def __init__(
+        self,
+        records: Sequence[Dict[str, Any]],
+        numeric: Dict[str, np.ndarray],
+        codes: Dict[str, np.ndarray],
+        categories: Dict[str, List[Hashable]],
+        absent: Dict[str, np.ndarray],
+    ) -> None:
+        self.records = records
+        self.numeric = numeric
+        self.codes = codes
+        self.categories = categories
+        self.absent = absent
+        self.size = len(records)
+        self._build_filter_index()
+        self._build_features()
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "CatalogColumns":
+        numeric: Dict[str, np.ndarray] = {}
+        codes: Dict[str, np.ndarray] = {}
+        categories: Dict[str, List[Hashable]] = {}
+        absent: Dict[str, np.ndarray] = {}
+
+        for name in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS:
+            absent[name] = np.fromiter(
+                (name not in car for car in records), dtype=bool, count=len(records)
+            )
+        for name in NUMERIC_COLUMNS:
+            numeric[name] = _floats([car.get(name) for car in records])
+        for name in CATEGORICAL_COLUMNS:
+            codes[name], categories[name] = _encode_categories([car.get(name) for car in records])
+
+        return cls(records, numeric, codes, categories, absent)
+
+    @classmethod
+    def from_snapshot(cls, records: SnapshotRecords) -> "CatalogColumns":
+        """
+        Build the columns straight from a memory-mapped snapshot.
+
+        Number columns are used as they are, and string columns are dictionary-encoded
+        by decoding each distinct string once. Rows are only decoded one by one for the
+        rare values that do not fit their column kind.
+        """
+        reader = records.reader
+        numeric: Dict[str, np.ndarray] = {}
+        codes: Dict[str, np.ndarray] = {}
+        categories: Dict[str, List[Hashable]] = {}
+        absent: Dict[str, np.ndarray] = {}
+
+        for name in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS:
+            states = reader.states.get(name)
+            absent[name] = np.ones(reader.rows, dtype=bool) if states is None else states == ABSENT
+
+        for name in NUMERIC_COLUMNS:
+            states = reader.states.get(name)
+            if states is not None and reader.kinds[name] == "number" and not (states == ENCODED).any():
+                stored = (states == VALUE) | (states == INT_VALUE)
+                numeric[name] = np.where(stored, reader.values[name], np.nan)
+            else:
+                numeric[name] = _floats(reader.column_values(name))
+
+        # Mirror the key defaults SnapshotRecords fills in when decoding rows
+        for name, default in records.defaults.items():
+            if name in numeric:
+                numeric[name] = np.where(absent[name], _as_float(default), numeric[name])
+            if name in absent:
+                absent[name] = np.zeros(reader.rows, dtype=bool)
+
+        for name in CATEGORICAL_COLUMNS:
+            states = reader.states.get(name)
+            if states is not None and reader.kinds[name] == "string" and not (states == ENCODED).any():
+                stored = states == VALUE
+                refs, inverse = np.unique(reader.values[name][stored], return_inverse=True)
+                ref_codes, categories[name] = _encode_categories([reader.string(int(ref)) for ref in refs])
+                column_codes = np.full(reader.rows, -1, dtype=np.int32)
+                column_codes[stored] = ref_codes[inverse]
+                codes[name] = column_codes
+            else:
+                codes[name], categories[name] = _encode_categories(reader.column_values(name))
+
+        return cls(records, numeric, codes, categories, absent)
+
+    def _build_filter_index(self) -> None:
+        """
+        Precompute the structures behind `candidate_rows`.
+
+        A missing or zero price/seat count never excludes a car, so those rows sort to
+        the always-kept end of the price order (-inf) and the seat order (+inf). Seat
+        buckets are the contiguous runs of equal counts in the seat order.
+        """
+        price = self.numeric["price"]
+        seats = self.numeric["seats"]
+        price_key = np.where(np.isnan(price) | (price == 0), -np.inf, price)
+        seat_key = np.where(np.isnan(seats) | (seats == 0), np.inf, seats)
+        self.price_order = np.argsort(price_key, kind="stable")
+        self.price_sorted = price_key[self.price_order]
+        self.seat_order = np.argsort(seat_key, kind="stable")
+        self.seat_sorted = seat_key[self.seat_order]
+
+        # Lowercased fuel type -> category codes, and the rows of each fuel type
+        fuel_codes = self.codes["fuel_type"]
+        self.fuel_code_groups: Dict[str, List[int]] = {}
+        for code, value in enumerate(self.categories["fuel_type"]):
+            self.fuel_code_groups.setdefault((value or "").lower(), []).append(code)
+        self.fuel_partitions: Dict[str, np.ndarray] = {
+            ftype: np.flatnonzero(np.isin(fuel_codes, group))
+            for ftype, group in self.fuel_code_groups.items()
+            if ftype
+        }
+        # Cars without a fuel type pass any fuel filter
+        self.fuel_untyped = np.flatnonzero(np.isin(fuel_codes, self.fuel_code_groups.get("", []) + [-1]))
+
+    def _with_absent_default(self, name: str) -> np.ndarray:
+        if name in ABSENT_AS_ZERO:
+            return np.where(self.absent[name], 0.0, self.numeric[name])
+        return self.numeric[name]
+
+    def _build_features(self) -> None:
+        """
+        Score every weight-independent feature once per catalog load.
+
+        `features[i]` holds the unweighted scores of `records[i]` in FEATURE_NAMES
+        order, so request-time scoring only multiplies by the weights and adds the
+        price fit. `price_for_fit` is the price column as the price-fit feature sees it.
+        """
+        # Score each distinct drivetrain once; the trailing None slot serves code -1
+        winter_lookup = winter_feature_batch(self.categories["drivetrain"] + [None])
+        ev_codes = [code for code, value in enumerate(self.categories["fuel_type"]) if (value or "").upper() == "EV"]
+        is_ev = np.isin(self.codes["fuel_type"], ev_codes)
+
+        l_per_100km = self.numeric["l_per_100km"]
+        effective_l = np.where(np.isnan(l_per_100km), mpg_to_l_per_100km_batch(self.numeric["mpg"]), l_per_100km)
+
+        self.features = np.column_stack(
+            [
+                winter_lookup[self.codes["drivetrain"]],
+                # EVs skip fuel efficiency (handled via ownership cost)
+                np.where(is_ev, 0.0, fuel_feature_batch(effective_l)),
+                acceleration_feature_batch(self._with_absent_default("zero_to_sixty")),
+                ownership_cost_feature_batch(self._with_absent_default("annual_cost")),
+                reliability_feature_batch(self._with_absent_default("reliability_score")),
+                safety_feature_batch(self._with_absent_default("safety_score")),
+            ]
+        )
+        self.price_for_fit = self._with_absent_default("price")
+
+    def candidate_rows(self, budget_cutoff: float, passengers: int, fuel_type: Optional[str] = None) -> np.ndarray:
+        """
+        Rows that survive the budget, seat and fuel type filters, in catalog order.
+
+        Each filter's candidate count comes from the prebuilt index (a binary search or
+        a partition size). Only the smallest set is materialized, and the other
+        predicates are checked against those rows alone.
+        """
+        price_end = int(np.searchsorted(self.price_sorted, budget_cutoff, side="right"))
+        seat_start = int(np.searchsorted(self.seat_sorted, passengers, side="left"))
+        ftype = fuel_type.lower() if fuel_type else None
+
+        sizes = {"price": price_end, "seats": self.size - seat_start}
+        if ftype is not None:
+            typed = self.fuel_partitions.get(ftype)
+            sizes["fuel"] = (len(typed) if typed is not None else 0) + len(self.fuel_untyped)
+        smallest = min(sizes, key=sizes.__getitem__)
+
+        if smallest == "price":
+            rows = self.price_order[:price_end]
+        elif smallest == "seats":
+            rows = self.seat_order[seat_start:]
+        else:
+            typed = self.fuel_partitions.get(ftype)
+            rows = self.fuel_untyped if typed is None else np.concatenate([typed, self.fuel_untyped])
+        rows = np.sort(rows)
+
+        keep = np.ones(len(rows), dtype=bool)
+        if smallest != "price":
+            price = self.numeric["price"][rows]
+            keep &= ~(price > budget_cutoff)
+        if smallest != "seats":
+            seats = self.numeric["seats"][rows]
+            keep &= ~((seats != 0) & (seats < passengers))
+        if ftype is not None and smallest != "fuel":
+            allowed = self.fuel_code_groups.get(ftype, []) + self.fuel_code_groups.get("", []) + [-1]
+            keep &= np.isin(self.codes["fuel_type"][rows], allowed)
+        return rows[keep]
+
+    def missing(self, name: str) -> np.ndarray:
+        """Boolean mask of rows with no usable value for `name`."""
+        if name in self.numeric:
+            return np.isnan(self.numeric[name])
+        return self.codes[name] < 0
+
+    def category_values(self, name: str, default: Optional[Hashable] = None) -> List[Any]:
+        """Per-row categorical values decoded back from their codes."""
+        cats = self.categories[name]
+        return [cats[c] if c >= 0 else default for c in self.codes[name]]
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return self.records[row]
+
+    def take(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        """Map row indexes back to the original catalog records."""
+        return [self.records[int(i)] for i in rows]
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
-import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
 import re
 
+import numpy as np
 import pandas as pd
 
+from app.data.catalog import CatalogWriter, save_catalog
+
 
 DATA_DIR = Path(__file__).resolve().parent
 RAW_DIR = DATA_DIR / "kaggle_raw"
@@ -95,62 +97,248 @@ def normalize_fuel_type(value: Any) -> Optional[str]:
     return None
 
 
-def build_kaggle_catalog(csv_path: Path, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-    df = pd.read_csv(csv_path, encoding="utf-8", encoding_errors="replace")
-    if limit:
-        df = df.head(limit)
+NUMBER_PATTERN = r"\d[\d,]*(?:\.\d+)?"
 
-    cars: List[Dict[str, Any]] = []
-    seen_ids = set()
 
-    for _, row in df.iterrows():
-        make = _title_case(row.get("Company Names"))
-        model = _title_case(row.get("Cars Names"))
-        if not make or not model:
-            continue
+def _by_unique(text: pd.Series, transform: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """
+    Run a column-wise transform once per distinct cell and spread the results back.
+
+    Catalog columns repeat the same few values (seat counts, fuel types, speeds), so
+    this does most of the work of ingestion only once per value.
+    """
+    codes, uniques = pd.factorize(text)
+    values = transform(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(values[codes], index=text.index)
+
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """`_normalize_text` over a whole column; a missing column reads as None, like `row.get`."""
+    if name not in df.columns:
+        return pd.Series("None", index=df.index, dtype=object)
+    return _by_unique(df[name].astype(str), lambda text: text.str.strip())
+
+
+def _title_case_column(text: pd.Series) -> pd.Series:
+    """`_title_case` over a column of normalized text, with NaN where it returns None."""
+    return _by_unique(text, lambda text: text.str.title().where((text != "") & (text.str.lower() != "nan")))
+
+
+def _scale_k(text: pd.Series, numbers: pd.Series, rows: Any) -> pd.Series:
+    # "k" anywhere in the cell scales every number in it below 1000
+    has_k = text.str.lower().str.contains("k", regex=False).to_numpy()[rows]
+    return numbers.where(~(has_k & (numbers.to_numpy() < 1000)), numbers * 1000)
+
+
+def _average_numbers(text: pd.Series) -> pd.Series:
+    matches = text.str.extractall(f"({NUMBER_PATTERN})")[0]
+    if matches.empty:
+        return pd.Series(np.nan, index=text.index)
+    numbers = matches.str.replace(",", "", regex=False).astype(float)
+    wide = _scale_k(text, numbers, matches.index.get_level_values(0)).unstack()
+    # Sum left to right like `sum()` so averaged ranges round the same way
+    total = wide[0]
+    for column in wide.columns[1:]:
+        total = total + wide[column].fillna(0.0)
+    return (total / wide.notna().sum(axis=1)).reindex(text.index)
+
+
+def _first_number(text: pd.Series) -> pd.Series:
+    numbers = text.str.extract(f"({NUMBER_PATTERN})", expand=False).str.replace(",", "", regex=False).astype(float)
+    return _scale_k(text, numbers, slice(None))
+
+
+def parse_price_column(text: pd.Series) -> pd.Series:
+    """`parse_price` over a column of normalized text; NaN where it returns None."""
+    return _by_unique(text, _average_numbers).astype(float)
+
+
+def parse_float_column(text: pd.Series) -> pd.Series:
+    """`parse_float` over a column of normalized text; NaN where it returns None."""
+    return _by_unique(text, _first_number).astype(float)
+
+
+def _fuel_types(text: pd.Series) -> pd.Series:
+    lower = text.str.lower()
+    fuel = np.full(len(text), None, dtype=object)
+    # Assigned lowest priority first, so earlier checks in normalize_fuel_type win
+    rules = [
+        ("gas", ("petrol", "gas")),
+        ("diesel", ("diesel",)),
+        ("hybrid", ("hybrid",)),
+        ("ev", ("electric", "ev")),
+    ]
+    for fuel_type, words in rules:
+        matched = np.logical_or.reduce([lower.str.contains(word, regex=False).to_numpy() for word in words])
+        fuel[matched] = fuel_type
+    return pd.Series(fuel, index=text.index)
+
 
-        year = YEAR_FALLBACK
-        price = parse_price(row.get("Cars Prices"))
-        fuel_type = normalize_fuel_type(row.get("Fuel Types"))
-        seats = parse_int(row.get("Seats"))
-        zero_to_sixty = parse_float(row.get("Performance(0 - 100 )KM/H"))
+def normalize_fuel_type_column(text: pd.Series) -> pd.Series:
+    """`normalize_fuel_type` over a column of normalized text."""
+    return _by_unique(text, _fuel_types)
 
-        car_id = _slugify([make, model, str(year)])
+
+def _slugify_column(parts: List[pd.Series]) -> pd.Series:
+    """`_slugify` over rows whose parts are all non-empty."""
+    raw = parts[0].str.cat(parts[1:], sep="_")
+    return _by_unique(
+        raw, lambda raw: raw.str.lower().str.replace(r"[^a-z0-9]+", "_", regex=True).str.strip("_")
+    )
+
+
+def _dedupe_ids(ids: List[str], seen_ids: Set[str]) -> List[str]:
+    """
+    Suffix repeated ids with the number of ids before them, as rows are added in order.
+
+    `seen_ids` holds the ids of earlier rows (earlier chunks, when streaming) and is
+    updated in place.
+    """
+    base = pd.Series(ids, dtype=object)
+    repeated = (base.duplicated() | base.isin(seen_ids)).to_numpy()
+    positions = pd.Series(np.arange(len(seen_ids), len(seen_ids) + len(base)).astype(str))
+    suffixed = base.where(~repeated, base + "_" + positions)
+    if suffixed.is_unique and not suffixed[repeated].isin(seen_ids).any():
+        seen_ids.update(suffixed.tolist())
+        return suffixed.tolist()
+    # A suffixed id collides with another id; only the sequential rule resolves that
+    deduped = []
+    for car_id in ids:
         if car_id in seen_ids:
             car_id = f"{car_id}_{len(seen_ids)}"
         seen_ids.add(car_id)
+        deduped.append(car_id)
+    return deduped
+
+
+def _optional_floats(values: pd.Series) -> List[Optional[float]]:
+    return [None if value != value else value for value in values.tolist()]
+
+
+def _optional_ints(values: pd.Series) -> List[Optional[int]]:
+    # np.round rounds half to even, like round()
+    return [None if value != value else int(value) for value in np.round(values.to_numpy(dtype=float)).tolist()]
+
+
+def read_kaggle_csv(csv_path: Path, limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Read the whole CSV. Every column is read as text, as iter_kaggle_chunks does, so a
+    numeric column renders "1500" rather than "1500.0" and both give the same records.
+    """
+    df = pd.read_csv(csv_path, encoding="utf-8", encoding_errors="replace", dtype=str)
+    if limit:
+        df = df.head(limit)
+    return df
 
-        cars.append(
-            {
-                "id": car_id,
-                "make": make,
-                "model": model,
-                "year": year,
-                "price": price,
-                "drivetrain": None,
-                "seats": seats,
-                "fuel_type": fuel_type,
-                "mpg": None,
-                "l_per_100km": None,
-                "zero_to_sixty": zero_to_sixty,
-                "annual_cost": None,
-                "reliability_score": None,
-                "safety_score": None,
-                "horsepower": parse_float(row.get("HorsePower")),
-                "engine": _normalize_text(row.get("Engines")),
-                "engine_cc_or_battery": _normalize_text(row.get("CC/Battery Capacity")),
-                "top_speed_kmh": parse_float(row.get("Total Speed")),
-                "torque": _normalize_text(row.get("Torque")),
-                "source": "kaggle",
-                "source_dataset": DATASET_SLUG,
-                "price_raw": _normalize_text(row.get("Cars Prices")),
-            }
-        )
-
-    return cars
+
+def iter_kaggle_chunks(csv_path: Path, chunk_size: int, limit: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Read the CSV `chunk_size` rows at a time. Every column is read as text, so a
+    chunk's type inference can't render a value differently from another chunk.
+    """
+    with pd.read_csv(
+        csv_path,
+        encoding="utf-8",
+        encoding_errors="replace",
+        dtype=str,
+        chunksize=chunk_size,
+        nrows=limit or None,
+    ) as reader:
+        yield from reader
+
+
+def kaggle_records(df: pd.DataFrame, seen_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Catalog records for the rows of a Kaggle dataframe, built a column at a time.
+
+    Gives exactly the records of parsing row by row with the scalar parsers above; see
+    scripts/check_kaggle_parity.py. When building a catalog chunk by chunk, pass the
+    same `seen_ids` set to every call so ids stay unique across chunks.
+    """
+    if seen_ids is None:
+        seen_ids = set()
+    make = _title_case_column(_text_column(df, "Company Names"))
+    model = _title_case_column(_text_column(df, "Cars Names"))
+    keep = (make.notna() & model.notna()).to_numpy()
+    df, make, model = df[keep], make[keep], model[keep]
+
+    year = YEAR_FALLBACK
+    price_raw = _text_column(df, "Cars Prices")
+    ids = _dedupe_ids(_slugify_column([make, model, pd.Series(str(year), index=df.index)]).tolist(), seen_ids)
+    columns = zip(
+        ids,
+        make.tolist(),
+        model.tolist(),
+        _optional_floats(parse_price_column(price_raw)),
+        _optional_ints(parse_float_column(_text_column(df, "Seats"))),
+        normalize_fuel_type_column(_text_column(df, "Fuel Types")).tolist(),
+        _optional_floats(parse_float_column(_text_column(df, "Performance(0 - 100 )KM/H"))),
+        _optional_floats(parse_float_column(_text_column(df, "HorsePower"))),
+        _text_column(df, "Engines").tolist(),
+        _text_column(df, "CC/Battery Capacity").tolist(),
+        _optional_floats(parse_float_column(_text_column(df, "Total Speed"))),
+        _text_column(df, "Torque").tolist(),
+        price_raw.tolist(),
+    )
+    return [
+        {
+            "id": car_id,
+            "make": make,
+            "model": model,
+            "year": year,
+            "price": price,
+            "drivetrain": None,
+            "seats": seats,
+            "fuel_type": fuel_type,
+            "mpg": None,
+            "l_per_100km": None,
+            "zero_to_sixty": zero_to_sixty,
+            "annual_cost": None,
+            "reliability_score": None,
+            "safety_score": None,
+            "horsepower": horsepower,
+            "engine": engine,
+            "engine_cc_or_battery": engine_cc_or_battery,
+            "top_speed_kmh": top_speed_kmh,
+            "torque": torque,
+            "source": "kaggle",
+            "source_dataset": DATASET_SLUG,
+            "price_raw": price_raw,
+        }
+        for (
+            car_id, make, model, price, seats, fuel_type, zero_to_sixty, horsepower,
+            engine, engine_cc_or_battery, top_speed_kmh, torque, price_raw,
+        ) in columns
+    ]
+
+
+def build_kaggle_catalog(csv_path: Path, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    return kaggle_records(read_kaggle_csv(csv_path, limit))
 
 
 def write_catalog(cars: List[Dict[str, Any]], output_path: Path) -> None:
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as f:
-        json.dump(cars, f, indent=2)
+    save_catalog(cars, output_path)
+
+
+def write_catalog_chunks(chunks: Iterable[List[Dict[str, Any]]], output_path: Path) -> int:
+    """
+    Write record chunks as they arrive and return the number written. Nothing is
+    written unless some chunk has records.
+    """
+    writer: Optional[CatalogWriter] = None
+    try:
+        for cars in chunks:
+            if not cars:
+                continue
+            if writer is None:
+                writer = CatalogWriter(output_path)
+            writer.append(cars)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is None:
+        return 0
+    writer.close()
+    return writer.rows
+
@@ -0,0 +1,340 @@
+"""
+Merge of several catalog sources into one catalog.
+
+Sources are joined on a blocking key of normalized (make, model, year). One pass over
+each source assigns its rows to blocks in a hash table, so the merge is linear in the
+total number of rows. Inside a block, the rows of each source are paired in order: the
+first Kaggle "Toyota Camry 2025" row with the first API one, the second with the second,
+and rows left over stand alone.
+
+Each field of a merged record comes from the first source in that field's precedence
+(FIELD_RULES) whose value is present; None, "" and, for fields the sync scripts write
+as 0 when they have nothing, 0 count as missing. Fields known per make/model/year
+(EPA figures, NHTSA results) can also come from another row of the same block. The
+record's `provenance` maps each of its fields to the source it was taken from.
+
+Some sources only supplement the others: the NHTSA results written by enrichment, for
+one, are keyed by make/model/year alone. Their rows fill in fields of records that
+other sources have, but never make a record of their own.
+
+Values are gathered a column at a time with NumPy, and the provenance dicts are shared
+by every record with the same field origins, so merged records must be treated as
+read-only like the rest of the catalog.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from itertools import chain, repeat
+from operator import itemgetter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.data.snapshot import ABSENT, SnapshotRecords
+
+PROVENANCE_FIELD = "provenance"
+
+# Rule scopes
+VEHICLE = "vehicle"  # only the paired rows can supply the value
+MODEL = "model"  # any row of the same make/model/year can, paired rows first
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    # Source names, most trusted first; sources not listed follow in merge order
+    precedence: Tuple[str, ...] = ()
+    scope: str = VEHICLE
+
+
+FIELD_RULES: Dict[str, FieldRule] = {
+    # EPA figures and NHTSA results are looked up per make/model/year
+    "mpg": FieldRule(("api",), MODEL),
+    "mpge": FieldRule(("api",), MODEL),
+    "l_per_100km": FieldRule(("api",), MODEL),
+    "annual_cost": FieldRule(("api",), MODEL),
+    "reliability_score": FieldRule(("nhtsa", "api"), MODEL),
+    "safety_score": FieldRule(("nhtsa", "api"), MODEL),
+    "complaints_count": FieldRule(("nhtsa", "api"), MODEL),
+    "recalls_count": FieldRule(("nhtsa", "api"), MODEL),
+    # Per trim from CarQuery/EPA; the Kaggle dataset has no drivetrain
+    "drivetrain": FieldRule(("api",)),
+    "fuel_type": FieldRule(("api",)),
+    # Current list prices and specs from the Kaggle dataset
+    "price": FieldRule(("kaggle",)),
+    "seats": FieldRule(("kaggle",)),
+    "zero_to_sixty": FieldRule(("kaggle",)),
+}
+DEFAULT_RULE = FieldRule()
+
+# A merged record is identified by its primary row: the first source, in merge order,
+# with a row in the pair
+IDENTITY_FIELDS = ("id", "make", "model", "year")
+
+# Fields the sync scripts write as 0 when no source had a value
+ZERO_IS_MISSING = frozenset({"price", "mpg"})
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+class _Absent:
+    """Marks a field the record does not have at all, as opposed to an explicit null."""
+
+    def __repr__(self) -> str:
+        return "<absent>"
+
+
+_ABSENT = _Absent()
+
+
+def _normalize(text: Any) -> str:
+    return _NON_ALNUM.sub("", str(text).casefold())
+
+
+def _normalize_year(year: Any) -> Any:
+    try:
+        return int(float(year))
+    except (TypeError, ValueError):
+        return _normalize(year)
+
+
+def _normalized(values: List[Any], normalize: Callable[[Any], Any]) -> List[Any]:
+    """`normalize` applied to each distinct value once; None for missing values."""
+
+    def one(value: Any) -> Any:
+        return None if not value or value is _ABSENT else normalize(value)
+
+    try:
+        table = {value: one(value) for value in dict.fromkeys(values)}
+    except TypeError:
+        # Unhashable values (dicts, lists) cannot be part of a key
+        return [one(value) if isinstance(value, Hashable) else None for value in values]
+    return list(map(table.__getitem__, values))
+
+
+def _objects(values: Sequence[Any]) -> np.ndarray:
+    # np.array would turn nested lists into extra dimensions
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+class _Source:
+    """
+    One source as object columns. Every column has an extra trailing entry that is
+    absent, so gathering with row -1 yields "no row".
+    """
+
+    def __init__(self, name: str, records: Sequence[Dict[str, Any]]) -> None:
+        self.name = name
+        self.rows = len(records)
+        self.columns: Dict[str, np.ndarray] = {}
+        self._masks: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        if isinstance(records, SnapshotRecords):
+            self._load_snapshot(records)
+        else:
+            self._load_records(records)
+        self.columns.pop(PROVENANCE_FIELD, None)
+
+    def _load_snapshot(self, records: SnapshotRecords) -> None:
+        # Straight from the columns; the records' `defaults` are left for after the merge,
+        # as they would be for records parsed from JSON
+        reader = records.reader
+        for field in reader.fields:
+            column = _objects(reader.column_values(field) + [_ABSENT])
+            column[np.append(reader.states[field] == ABSENT, True)] = _ABSENT
+            self.columns[field] = column
+
+    def _load_records(self, records: Sequence[Dict[str, Any]]) -> None:
+        # Records with the same keys are read a field at a time with itemgetter
+        layouts: Dict[Tuple[str, ...], List[int]] = {}
+        for row, record in enumerate(records):
+            layouts.setdefault(tuple(record), []).append(row)
+        for field in dict.fromkeys(chain.from_iterable(layouts)):
+            self.columns[field] = np.full(self.rows + 1, _ABSENT, dtype=object)
+        for layout, rows in layouts.items():
+            group = records if len(rows) == self.rows else [records[row] for row in rows]
+            index = slice(0, self.rows) if group is records else np.array(rows, dtype=np.int64)
+            if len(layout) == 1:
+                self.columns[layout[0]][index] = _objects(list(map(itemgetter(layout[0]), group)))
+            elif layout:
+                for field, values in zip(layout, zip(*map(itemgetter(*layout), group))):
+                    self.columns[field][index] = _objects(values)
+
+    def block_ids(self, blocks: Dict[Tuple[Any, ...], int]) -> np.ndarray:
+        """
+        Block of each row: the id of its normalized (make, model, year) in `blocks`, added
+        if new, or -1 when one of them is missing.
+        """
+        parts = []
+        for name, normalize in (("make", _normalize), ("model", _normalize), ("year", _normalize_year)):
+            column = self.columns.get(name)
+            if column is None:
+                return np.full(self.rows, -1, dtype=np.int64)
+            parts.append(_normalized(column[:-1].tolist(), normalize))
+        ids = []
+        for key in zip(*parts):
+            ids.append(-1 if None in key else blocks.setdefault(key, len(blocks)))
+        return np.array(ids, dtype=np.int64)
+
+    def masks(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Which rows have the field at all, and which have a usable (non-missing) value."""
+        masks = self._masks.get(field)
+        if masks is None:
+            column = self.columns[field]
+            present = column != _ABSENT
+            usable = present & (column != None) & (column != "")  # noqa: E711 (elementwise)
+            if field in ZERO_IS_MISSING:
+                usable &= column != 0
+            masks = self._masks[field] = (present, usable)
+        return masks
+
+
+def _first_per_block(
+    values: np.ndarray, blocks: np.ndarray, usable: np.ndarray, block_count: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each block, the first usable value among a source's rows in it and whether there
+    was one. Both have a trailing entry for rows without a block.
+    """
+    out = np.full(block_count + 1, _ABSENT, dtype=object)
+    found = np.zeros(block_count + 1, dtype=bool)
+    rows = np.flatnonzero(usable & (blocks >= 0))
+    first_blocks, first = np.unique(blocks[rows], return_index=True)
+    out[first_blocks] = values[rows[first]]
+    found[first_blocks] = True
+    return out, found
+
+
+def _without_supplement_only(
+    records: List[Any], rows_in_slot: List[np.ndarray], names: List[str], supplements: Sequence[str]
+) -> List[Dict[str, Any]]:
+    """The records of the slots that have a row from a source not named in `supplements`."""
+    if not supplements:
+        return records
+    primary = [rows >= 0 for rows, name in zip(rows_in_slot, names) if name not in supplements]
+    kept = np.logical_or.reduce(primary) if primary else np.zeros(len(records), dtype=bool)
+    return [record for record, keep in zip(records, kept.tolist()) if keep]
+
+
+def merge_catalogs(
+    sources: Sequence[Tuple[str, Sequence[Dict[str, Any]]]],
+    rules: Optional[Dict[str, FieldRule]] = None,
+    supplements: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Merge (name, records) sources, given in merge order, into one list of records.
+
+    Records keep the order of the first source; rows of later sources that did not pair
+    with an earlier one follow in their own order. Rows of the sources named in
+    `supplements` only contribute to records that another source has a row in.
+    """
+    if not sources:
+        return []
+    rules = FIELD_RULES if rules is None else rules
+    loaded = [_Source(name, records) for name, records in sources]
+    names = [source.name for source in loaded]
+
+    # Hash join: every row goes to the block of its normalized key...
+    block_ids: Dict[Tuple[Any, ...], int] = {}
+    source_blocks = [source.block_ids(block_ids) for source in loaded]
+    block_count = len(block_ids)
+
+    # ...and to the slot of its (block, rank within the block) pair. Rows without a block
+    # get a slot of their own. Slots are numbered in order of first appearance.
+    pair_keys = []
+    for blocks in source_blocks:
+        order = np.argsort(blocks, kind="stable")
+        sorted_blocks = blocks[order]
+        starts = np.flatnonzero(np.r_[True, sorted_blocks[1:] != sorted_blocks[:-1]])
+        ranks = np.empty_like(blocks)
+        ranks[order] = np.arange(len(blocks)) - np.repeat(starts, np.diff(np.r_[starts, len(blocks)]))
+        pair_keys.append((blocks, ranks))
+    rank_limit = max((int(ranks.max()) + 1 for _, ranks in pair_keys if len(ranks)), default=1)
+    offset = 0
+    combined = []
+    for blocks, ranks in pair_keys:
+        unique = -1 - offset - np.arange(len(blocks), dtype=np.int64)  # distinct negatives for unblocked rows
+        combined.append(np.where(blocks >= 0, blocks * rank_limit + ranks, unique - rank_limit))
+        offset += len(blocks)
+    all_keys = np.concatenate(combined) if combined else np.zeros(0, dtype=np.int64)
+    _, first, inverse = np.unique(all_keys, return_index=True, return_inverse=True)
+    slot_of = np.empty(len(first), dtype=np.int64)
+    slot_of[np.argsort(first, kind="stable")] = np.arange(len(first))
+    row_slots = slot_of[inverse.reshape(-1)]
+
+    slot_count = len(first)
+    out_blocks = np.empty(slot_count, dtype=np.int64)
+    out_blocks[row_slots] = np.concatenate(source_blocks)
+    # Row of each source in each slot; -1 (the trailing absent entry) where it has none
+    rows_in_slot: List[np.ndarray] = []
+    offset = 0
+    for source in loaded:
+        rows = np.full(slot_count, -1, dtype=np.int64)
+        rows[row_slots[offset:offset + source.rows]] = np.arange(source.rows, dtype=np.int64)
+        rows_in_slot.append(rows)
+        offset += source.rows
+
+    fields: Dict[str, None] = {}
+    for source in loaded:
+        fields.update(dict.fromkeys(source.columns))
+    if not fields:
+        return _without_supplement_only([{PROVENANCE_FIELD: {}} for _ in range(slot_count)], rows_in_slot, names, supplements)
+
+    values: List[np.ndarray] = []
+    origins = np.full((slot_count, len(fields)), -1, dtype=np.int8)
+    for position, field in enumerate(fields):
+        rule = rules.get(field, DEFAULT_RULE)
+        if field in IDENTITY_FIELDS:
+            order = list(range(len(loaded)))
+        else:
+            preferred = [names.index(name) for name in rule.precedence if name in names]
+            order = preferred + [index for index in range(len(loaded)) if index not in preferred]
+        order = [index for index in order if field in loaded[index].columns]
+
+        merged = np.full(slot_count, _ABSENT, dtype=object)
+        origin = origins[:, position]
+        candidates = []
+        for index in order:
+            rows = rows_in_slot[index]
+            present, usable = loaded[index].masks(field)
+            usable = present[rows] if field in IDENTITY_FIELDS else usable[rows]
+            candidates.append((index, loaded[index].columns[field][rows], usable))
+        if rule.scope == MODEL and field not in IDENTITY_FIELDS:
+            for index in order:
+                column = loaded[index].columns[field]
+                usable = loaded[index].masks(field)[1]
+                per_block, found = _first_per_block(column[:-1], source_blocks[index], usable[:-1], block_count)
+                candidates.append((index, per_block[out_blocks], found[out_blocks]))
+        for index, gathered, usable in candidates:
+            take = usable & (origin < 0)
+            merged[take] = gathered[take]
+            origin[take] = index
+        # With no usable value anywhere, keep the first explicit one (a null or 0)
+        for index in order:
+            unset = origin < 0
+            if not unset.any():
+                break
+            rows = rows_in_slot[index]
+            take = unset & loaded[index].masks(field)[0][rows]
+            merged[take] = loaded[index].columns[field][rows[take]]
+            origin[take] = index
+        values.append(merged)
+
+    # Records with the same field origins share one provenance dict and one key layout
+    field_names = list(fields)
+    patterns, inverse = np.unique(
+        np.ascontiguousarray(origins).view(np.dtype((np.void, len(field_names)))).ravel(), return_inverse=True
+    )
+    slot_order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[slot_order], np.arange(len(patterns) + 1))
+    merged_records: List[Any] = [None] * slot_count
+    for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        group = slot_order[start:stop]
+        pattern = origins[group[0]].tolist()
+        present = [position for position, index in enumerate(pattern) if index >= 0]
+        provenance = {field_names[position]: names[pattern[position]] for position in present}
+        keys = [field_names[position] for position in present] + [PROVENANCE_FIELD]
+        columns = [values[position][group].tolist() for position in present]
+        for slot, row in zip(group.tolist(), zip(*columns, repeat(provenance))):
+            merged_records[slot] = dict(zip(keys, row))
+    return _without_supplement_only(merged_records, rows_in_slot, names, supplements)
@@ -0,0 +1,447 @@
+"""
+Compact binary snapshot of a catalog file, written next to the JSON and memory-mapped
+by the loader.
+
+Published snapshots are named after their catalog generation (`vehicles.7.bin` next to
+`vehicles.json`) rather than replaced in place: Windows refuses to replace or delete a
+file that is memory-mapped, and a running server keeps its snapshot mapped until it
+loads the next one. Readers take the newest snapshot written from the current JSON.
+
+Layout (integers in the byte order recorded in the header):
+
+    b"CARSNAP1" | uint64 header length | JSON header | padding to 8 | sections
+
+Every field of the records becomes a column with a uint8 state per row and a fixed
+width value per row (float64 for numbers, int64 string-table references otherwise).
+Strings live once in a shared string table (int64 offsets + UTF-8 blob). Values that
+do not fit the column kind (dicts, lists, bools, mixed types) are stored as JSON text
+in the string table. A uint32 per row points at the record's key order, so decoded
+records match the JSON ones key for key.
+"""
+
+from __future__ import annotations
+
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+
+MAGIC = b"CARSNAP1"
+VERSION = 1
+SNAPSHOT_SUFFIX = ".bin"
+
+# Per-row states
+ABSENT = 0  # key missing from the record
+NULL = 1  # key present with a null value
+VALUE = 2  # float for number columns, string-table reference otherwise
+INT_VALUE = 3  # number column value that was an int
+ENCODED = 4  # string-table reference to the JSON encoding of the value
+
+# Only dedupe this many distinct strings so writer memory stays bounded
+STRING_DEDUP_LIMIT = 65536
+MAX_EXACT_INT = 2**53
+
+
+def snapshot_path_for(json_path: Path, generation: Optional[int] = None) -> Path:
+    """`vehicles.bin` for `vehicles.json`, or `vehicles.<generation>.bin` for a published one."""
+    if generation is None:
+        return json_path.with_suffix(SNAPSHOT_SUFFIX)
+    return json_path.with_suffix(f".{generation}{SNAPSHOT_SUFFIX}")
+
+
+def snapshot_paths_for(json_path: Path) -> List[Path]:
+    """Snapshots of `json_path` on disk, newest generation first and the unnumbered one last."""
+    numbered = []
+    for path in json_path.parent.glob(f"{json_path.stem}.*{SNAPSHOT_SUFFIX}"):
+        generation = path.name[len(json_path.stem) + 1 : -len(SNAPSHOT_SUFFIX)]
+        if generation.isdigit():
+            numbered.append((int(generation), path))
+    paths = [path for _, path in sorted(numbered, reverse=True)]
+    unnumbered = snapshot_path_for(json_path)
+    if unnumbered.exists():
+        paths.append(unnumbered)
+    return paths
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Column:
+    def __init__(self, kind: str, spool_dir: Path, name_index: int, backfill: int) -> None:
+        self.kind = kind
+        self.state_path = spool_dir / f"{name_index}.state"
+        self.values_path = spool_dir / f"{name_index}.values"
+        self.state = array("B")
+        self.values = array("d") if kind == "number" else array("q")
+        self.state_file = self.state_path.open("wb")
+        self.values_file = self.values_path.open("wb")
+        if backfill:
+            self.state_file.write(bytes(backfill))
+            self.values_file.write(bytes(8 * backfill))
+
+    def flush(self) -> None:
+        self.state_file.write(self.state.tobytes())
+        self.values_file.write(self.values.tobytes())
+        del self.state[:]
+        del self.values[:]
+
+    def close(self) -> None:
+        self.flush()
+        self.state_file.close()
+        self.values_file.close()
+
+
+class SnapshotWriter:
+    """
+    Incremental snapshot writer: `append()` any number of record batches, then `close()`.
+
+    Columns are spooled to temporary files between batches, so memory use depends on
+    the batch size rather than on the catalog size. The finished file is written next
+    to the target and renamed into place.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._spool = Path(tempfile.mkdtemp(prefix=".snapshot-", dir=str(path.parent)))
+        self._columns: Dict[str, _Column] = {}
+        self._rows = 0
+        self._string_count = 0
+        self._string_size = 0
+        self._string_ends = array("q")
+        self._string_ids: Dict[str, int] = {}
+        self._strings_file = (self._spool / "strings").open("wb")
+        self._offsets_file = (self._spool / "offsets").open("wb")
+        self._offsets_file.write(array("q", [0]).tobytes())
+        self._key_orders: Dict[tuple, int] = {}
+        self._row_key_orders = array("I")
+        self._key_orders_file = (self._spool / "key_orders").open("wb")
+
+    def _string_ref(self, text: str) -> int:
+        ref = self._string_ids.get(text)
+        if ref is not None:
+            return ref
+        data = text.encode("utf-8", "surrogatepass")
+        self._strings_file.write(data)
+        self._string_size += len(data)
+        self._string_ends.append(self._string_size)
+        ref = self._string_count
+        self._string_count += 1
+        if len(self._string_ids) < STRING_DEDUP_LIMIT:
+            self._string_ids[text] = ref
+        return ref
+
+    def _add_columns(self, batch: List[Dict[str, Any]]) -> None:
+        """Create columns for fields first seen in this batch, in order of appearance."""
+        kinds: Dict[str, Optional[str]] = {}
+        for record in batch:
+            for name, value in record.items():
+                if name in self._columns or kinds.get(name) is not None:
+                    continue
+                if value is None:
+                    kinds.setdefault(name, None)
+                elif _is_number(value):
+                    kinds[name] = "number"
+                elif isinstance(value, str):
+                    kinds[name] = "string"
+                else:
+                    kinds[name] = "json"
+        for name, kind in kinds.items():
+            # All-null fields get a number column; later strings are stored ENCODED
+            self._columns[name] = _Column(kind or "number", self._spool, len(self._columns), self._rows)
+
+    def _encode(self, column: _Column, value: Any) -> None:
+        if value is None:
+            column.state.append(NULL)
+            column.values.append(0)
+        elif column.kind == "number" and _is_number(value):
+            if isinstance(value, int):
+                if abs(value) > MAX_EXACT_INT:
+                    column.state.append(ENCODED)
+                    column.values.append(float(self._string_ref(json.dumps(value))))
+                    return
+                column.state.append(INT_VALUE)
+            else:
+                column.state.append(VALUE)
+            column.values.append(float(value))
+        elif column.kind == "string" and isinstance(value, str):
+            column.state.append(VALUE)
+            column.values.append(self._string_ref(value))
+        else:
+            ref = self._string_ref(json.dumps(value))
+            column.state.append(VALUE if column.kind == "json" else ENCODED)
+            column.values.append(float(ref) if column.kind == "number" else ref)
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> None:
+        batch = list(records)
+        self._add_columns(batch)
+        for record in batch:
+            keys = tuple(record)
+            key_order = self._key_orders.get(keys)
+            if key_order is None:
+                key_order = self._key_orders[keys] = len(self._key_orders)
+            self._row_key_orders.append(key_order)
+            for name, column in self._columns.items():
+                if name in record:
+                    self._encode(column, record[name])
+                else:
+                    column.state.append(ABSENT)
+                    column.values.append(0)
+        self._rows += len(batch)
+        for column in self._columns.values():
+            column.flush()
+        self._offsets_file.write(self._string_ends.tobytes())
+        del self._string_ends[:]
+        self._key_orders_file.write(self._row_key_orders.tobytes())
+        del self._row_key_orders[:]
+
+    def close(self, source: Optional[Path] = None) -> None:
+        """Assemble the snapshot and rename it into place; `source` is the JSON file it mirrors, if any."""
+        os.replace(self.assemble(source), self.path)
+
+    def assemble(
+        self,
+        source: Optional[Path] = None,
+        source_name: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Path:
+        """
+        Write the finished snapshot to a temporary file next to the target and return its
+        path, leaving the rename to the caller. `source_name` is recorded instead of
+        `source`'s own name when the JSON is itself still a temporary file. `metadata`
+        is stored in the header as it is.
+        """
+        for column in self._columns.values():
+            column.close()
+        self._offsets_file.close()
+        self._strings_file.close()
+        self._key_orders_file.close()
+
+        sections: List[Path] = []
+        header: Dict[str, Any] = {
+            "version": VERSION,
+            "rows": self._rows,
+            "byteorder": sys.byteorder,
+            "columns": {},
+        }
+        offset = 0
+
+        def add_section(path: Path) -> List[int]:
+            nonlocal offset
+            size = path.stat().st_size
+            sections.append(path)
+            padded = size + (-size % 8)
+            span = [offset, size]
+            offset += padded
+            return span
+
+        for name, column in self._columns.items():
+            header["columns"][name] = {
+                "kind": column.kind,
+                "state": add_section(column.state_path),
+                "values": add_section(column.values_path),
+            }
+        fields = list(self._columns)
+        header["key_orders"] = [[fields.index(name) for name in keys] for keys in self._key_orders]
+        header["row_key_orders"] = add_section(self._spool / "key_orders")
+        header["string_offsets"] = add_section(self._spool / "offsets")
+        header["string_data"] = add_section(self._spool / "strings")
+        if source is not None and source.exists():
+            stat = source.stat()
+            header["source"] = {"name": source_name or source.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if metadata is not None:
+            header["metadata"] = metadata
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * (-(len(MAGIC) + 8 + len(header_bytes)) % 8)
+        tmp_path = self._spool.with_suffix(SNAPSHOT_SUFFIX)
+        try:
+            with tmp_path.open("wb") as out:
+                out.write(MAGIC)
+                out.write(len(header_bytes).to_bytes(8, "little"))
+                out.write(header_bytes)
+                for section in sections:
+                    with section.open("rb") as f:
+                        shutil.copyfileobj(f, out)
+                    out.write(bytes(-out.tell() % 8))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            shutil.rmtree(self._spool, ignore_errors=True)
+        return tmp_path
+
+    def abort(self) -> None:
+        for column in self._columns.values():
+            column.state_file.close()
+            column.values_file.close()
+        self._offsets_file.close()
+        self._strings_file.close()
+        self._key_orders_file.close()
+        shutil.rmtree(self._spool, ignore_errors=True)
+
+
+def write_snapshot(records: Iterable[Dict[str, Any]], path: Path, source: Optional[Path] = None) -> None:
+    writer = SnapshotWriter(path)
+    try:
+        writer.append(records)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close(source)
+
+
+class SnapshotReader:
+    """Memory-mapped, read-only view of a snapshot file."""
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mm[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a catalog snapshot")
+            header_len = int.from_bytes(self._mm[len(MAGIC) : len(MAGIC) + 8], "little")
+            data_start = len(MAGIC) + 8 + header_len
+            self.header = json.loads(self._mm[len(MAGIC) + 8 : data_start].decode("utf-8"))
+            if self.header.get("version") != VERSION or self.header.get("byteorder") != sys.byteorder:
+                raise ValueError(f"Unsupported snapshot format in {path}")
+        except Exception:
+            self._mm.close()
+            raise
+        self.path = path
+        self.rows: int = self.header["rows"]
+        self.fields: List[str] = list(self.header["columns"])
+        self._data_start = data_start
+
+        def view(span: List[int], dtype: Any) -> np.ndarray:
+            offset, size = span
+            return np.frombuffer(self._mm, dtype=dtype, count=size // np.dtype(dtype).itemsize, offset=data_start + offset)
+
+        self.kinds: Dict[str, str] = {}
+        self.states: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        for name, spec in self.header["columns"].items():
+            self.kinds[name] = spec["kind"]
+            self.states[name] = view(spec["state"], np.uint8)
+            self.values[name] = view(spec["values"], np.float64 if spec["kind"] == "number" else np.int64)
+        self._key_orders = [[self.fields[i] for i in keys] for keys in self.header["key_orders"]]
+        self._row_key_orders = view(self.header["row_key_orders"], np.uint32)
+        self._string_offsets = view(self.header["string_offsets"], np.int64)
+        self._string_base = data_start + self.header["string_data"][0]
+
+    def matches_source(self, source: Path) -> bool:
+        """True when the snapshot was written from the current contents of `source`."""
+        recorded = self.header.get("source")
+        if recorded is None:
+            return False
+        try:
+            stat = source.stat()
+        except OSError:
+            return False
+        return recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns
+
+    def string(self, ref: int) -> str:
+        start = self._string_base + int(self._string_offsets[ref])
+        end = self._string_base + int(self._string_offsets[ref + 1])
+        return self._mm[start:end].decode("utf-8", "surrogatepass")
+
+    def _decode(self, name: str, row: int) -> Any:
+        state = self.states[name][row]
+        if state == NULL:
+            return None
+        value = self.values[name][row]
+        if state == INT_VALUE:
+            return int(value)
+        if state == ENCODED or (state == VALUE and self.kinds[name] == "json"):
+            return json.loads(self.string(int(value)))
+        if self.kinds[name] == "number":
+            return float(value)
+        return self.string(int(value))
+
+    def record(self, row: int) -> Dict[str, Any]:
+        keys = self._key_orders[self._row_key_orders[row]]
+        return {name: self._decode(name, row) for name in keys}
+
+    def column_values(self, name: str) -> List[Any]:
+        """Decode one column for every row, decoding each distinct string only once."""
+        if name not in self.states:
+            return [None] * self.rows
+        kind = self.kinds[name]
+        states = self.states[name]
+        values = self.values[name]
+        out = np.full(self.rows, None, dtype=object)
+        if kind == "string":
+            stored = states == VALUE
+            refs, inverse = np.unique(values[stored], return_inverse=True)
+            texts = np.empty(len(refs), dtype=object)
+            texts[:] = [self.string(ref) for ref in refs.tolist()]
+            out[stored] = texts[inverse.reshape(-1)]
+        elif kind == "number":
+            stored = states == VALUE
+            out[stored] = values[stored].astype(object)
+            ints = states == INT_VALUE
+            out[ints] = values[ints].astype(np.int64).astype(object)
+            stored |= ints
+        else:
+            stored = np.zeros(self.rows, dtype=bool)
+        # Values that do not fit the column kind
+        for row in np.flatnonzero(~stored & (states != ABSENT) & (states != NULL)).tolist():
+            out[row] = self._decode(name, row)
+        return out.tolist()
+
+
+class SnapshotRecords(Sequence):
+    """
+    List-like access to the records of a snapshot; rows are decoded on access.
+
+    `defaults` are filled in for keys a record does not have, matching what the
+    JSON loader does to the parsed records.
+    """
+
+    def __init__(self, reader: SnapshotReader, defaults: Optional[Dict[str, Any]] = None) -> None:
+        self.reader = reader
+        self.defaults = defaults or {}
+
+    def __len__(self) -> int:
+        return self.reader.rows
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("snapshot row out of range")
+        record = self.reader.record(index)
+        for key, value in self.defaults.items():
+            record.setdefault(key, value)
+        return record
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self[row]
+
+
+def open_snapshot(path: Path) -> Optional[SnapshotReader]:
+    try:
+        return SnapshotReader(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def open_current_snapshot(json_path: Path) -> Optional[SnapshotReader]:
+    """The newest snapshot written from the current contents of `json_path`, or None."""
+    for path in snapshot_paths_for(json_path):
+        reader = open_snapshot(path)  # None if a publisher removed it meanwhile
+        if reader is not None and reader.matches_source(json_path):
+            return reader
+    return None
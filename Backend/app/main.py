@@ -1,15 +1,40 @@
+import asyncio
+import json
 import uuid
+from contextlib import asynccontextmanager, suppress
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from app.models import CarRecommendationRequest, ChatRequest, ChatResponse
+from fastapi.responses import StreamingResponse
+from app.models import BatchRecommendationRequest, CarRecommendationRequest, ChatRequest, ChatResponse
 from app.ai.agent import run_agent
 from app.ai.memory import get_history, reset_memory
-from app.recommendations import build_recommendations
-from app.services.nhtsa_issues import get_complaints_and_recalls
-from app.data.catalog import load_cars_with_meta
+from app.recommendations import (
+    build_batch_recommendations,
+    build_recommendations,
+    iter_recommendations,
+    result_cache_stats,
+)
+from app.services import http_cache, http_client, nhtsa_refresh
+from app.services.nhtsa_issues import get_complaints_and_recalls_async, nhtsa_stats
+from app.data.catalog import catalog_load_error, get_catalog
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler = nhtsa_refresh.scheduler
+    refresh_task = asyncio.create_task(scheduler.run()) if scheduler.enabled else None
+    yield
+    if refresh_task is not None:
+        scheduler.stop()
+        refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresh_task
+    await http_client.close_async_clients()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow local frontend/dev tools
 app.add_middleware(
@@ -26,35 +51,74 @@ def recommend_car(request: CarRecommendationRequest) -> dict:
     return build_recommendations(request)
 
 
+@app.post("/recommend/batch")
+def recommend_batch(request: BatchRecommendationRequest) -> dict:
+    return build_batch_recommendations(request.requests, limit=request.limit)
+
+
+@app.post("/recommend/stream")
+def recommend_stream(
+    request: CarRecommendationRequest,
+    limit: Optional[int] = Query(None, ge=0),
+) -> StreamingResponse:
+    """Stream the full ranking (or its top `limit`) as newline-delimited JSON."""
+    catalog = get_catalog()
+    lines = (json.dumps(result) + "\n" for result in iter_recommendations(request, limit, catalog))
+    headers = {
+        "X-Using-Mock-Data": str(catalog.using_mock).lower(),
+        "X-Catalog-Last-Updated": str(catalog.last_updated or ""),
+    }
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/recommend/cache")
+def recommend_cache_stats() -> dict:
+    return result_cache_stats()
+
+
 @app.get("/nhtsa/issues")
-def nhtsa_issues(make: str, model: str, model_year: int) -> dict:
-    return get_complaints_and_recalls(model_year, make, model)
+async def nhtsa_issues(make: str, model: str, model_year: int) -> dict:
+    return await get_complaints_and_recalls_async(model_year, make, model)
+
+
+@app.get("/nhtsa/stats")
+def nhtsa_cache_stats() -> dict:
+    return nhtsa_stats()
+
+
+@app.get("/admin/http")
+def http_stats() -> dict:
+    """Per-host request counts, retries, errors and latency, plus response cache counters."""
+    return {"hosts": http_client.stats(), "cache": http_cache.stats()}
+
+
+@app.get("/admin/nhtsa/refresh")
+def nhtsa_refresh_stats() -> dict:
+    """Background NHTSA refresh activity and the entries still due for a refresh."""
+    return nhtsa_refresh.scheduler.stats()
 
 
 @app.get("/")
 def health() -> dict:
-    catalog, using_mock, last_updated = load_cars_with_meta()
+    catalog = get_catalog()
     return {
         "status": "ok",
-        "catalog_size": len(catalog),
-        "using_mock_data": using_mock,
-        "catalog_last_updated": last_updated,
+        "catalog_size": len(catalog.cars),
+        "using_mock_data": catalog.using_mock,
+        "catalog_last_updated": catalog.last_updated,
+        "catalog_generation": catalog.published_generation,
+        "catalog_load_error": catalog_load_error(),
     }
 
 
 @app.get("/models")
 def list_models() -> dict:
-    catalog, using_mock, last_updated = load_cars_with_meta()
-    items = [
-        {"make": c.get("make"), "model": c.get("model"), "year": c.get("year")}
-        for c in catalog
-    ]
-    unique = {f"{i['make']}_{i['model']}_{i['year']}": i for i in items if i["make"] and i["model"] and i["year"]}
+    catalog = get_catalog()
     return {
-        "count": len(unique),
-        "using_mock_data": using_mock,
-        "catalog_last_updated": last_updated,
-        "models": list(unique.values()),
+        "count": len(catalog.models),
+        "using_mock_data": catalog.using_mock,
+        "catalog_last_updated": catalog.last_updated,
+        "models": catalog.models,
     }
 
 
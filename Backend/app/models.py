@@ -19,6 +19,11 @@ class CarRecommendationRequest(BaseModel):
     )
 
 
+class BatchRecommendationRequest(BaseModel):
+    requests: List[CarRecommendationRequest] = Field(min_length=1, description="Profiles to recommend for")
+    limit: int = Field(default=5, ge=0, description="Results per profile")
+
+
 class ChatRequest(BaseModel):
     message: str = Field(min_length=1, description="User message")
     session_id: Optional[str] = Field(default=None, description="Optional session ID")
@@ -1,12 +1,19 @@
-from typing import Any, Dict, List
+import heapq
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from app.data.catalog import load_cars_with_meta
+import numpy as np
+
+from app.cache import LRUCache
+from app.data.catalog import CatalogSnapshot, get_catalog
+from app.data.columns import FEATURE_NAMES, CatalogColumns
 from app.models import CarRecommendationRequest
 from app.recommender import (
     acceleration_score,
     fuel_score,
     normalize_weights,
     ownership_cost_score,
+    price_fit_feature_batch,
     price_fit_score,
     reliability_score,
     safety_score,
@@ -24,89 +31,338 @@ DEFAULT_WEIGHTS = {
     "safety": 0.10,
 }
 
+# Score with the NumPy batch features by default; set VECTORIZED_SCORING=0 to use
+# the per-car scalar path.
+VECTORIZED_SCORING = os.getenv("VECTORIZED_SCORING", "1") != "0"
 
-def build_recommendations(request: CarRecommendationRequest, limit: int = 5) -> Dict[str, Any]:
-    raw_weights = request.weights or DEFAULT_WEIGHTS
-    weights = normalize_weights(raw_weights)
+# Cache of full /recommend responses, keyed on the normalized request and the catalog
+# generation. Cached responses are shared between callers and must not be mutated.
+RESULT_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RECOMMEND_CACHE_TTL_SECONDS", "300"))
+_RESULT_CACHE = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_SECONDS)
+_RESULT_CACHE_GENERATION = 0
+
+# Upper bound on profile x car cells scored at once by build_batch_recommendations
+BATCH_SCORE_CELLS = 4_000_000
+
+# Rows scored and serialized per step by iter_recommendations
+STREAM_CHUNK_ROWS = 4096
+
+# Points are (winter, fuel, price, acceleration, ownership_cost, reliability, safety)
+Points = Tuple[float, float, float, float, float, float, float]
+
+# Results are ranked on total_score rounded to 4 places. round() is monotonic, so any
+# car that can tie the k-th best after rounding is within one rounding step of it.
+ROUNDING_SLACK = 2e-4
 
-    catalog, using_mock, last_updated = load_cars_with_meta()
-    budget_cutoff = request.budget * 1.2
-    results: List[Dict[str, Any]] = []
-
-    for car in catalog:
-        if car.get("price") and car["price"] > budget_cutoff:
-            continue
-        if car.get("seats") and car["seats"] < request.passengers:
-            continue
-        if request.fuel_type:
-            ftype = (request.fuel_type or "").lower()
-            ctype = (car.get("fuel_type") or "").lower()
-            if ctype and ctype != ftype:
-                continue
-
-        w_winter = weights.get("winter_driving", 0.0)
-        w_fuel = weights.get("fuel_efficiency", 0.0)
-        w_price = weights.get("price_fit", 0.0)
-        w_accel = weights.get("acceleration", 0.0)
-        w_own = weights.get("ownership_cost", 0.0)
-        w_rely = weights.get("reliability", 0.0)
-        w_safety = weights.get("safety", 0.0)
-
-        winter_points = winter_score(car.get("drivetrain", ""), w_winter)
-        fuel_points = fuel_score(
+
+def _score_car(car: Dict[str, Any], request: CarRecommendationRequest, weights: Dict[str, float]) -> Points:
+    return (
+        winter_score(car.get("drivetrain", ""), weights.get("winter_driving", 0.0)),
+        fuel_score(
             car.get("l_per_100km"),
             car.get("mpg"),
             car.get("fuel_type"),
-            w_fuel,
-        )
-        price_points = price_fit_score(car.get("price", 0.0), request.budget, w_price)
-        accel_points = acceleration_score(car.get("zero_to_sixty", 0.0), w_accel)
-        own_points = ownership_cost_score(car.get("annual_cost", 0.0), w_own)
-        rely_points = reliability_score(car.get("reliability_score", 0.0), w_rely)
-        safety_points = safety_score(car.get("safety_score", 0.0), w_safety)
-
-        total_score = (
-            winter_points
-            + fuel_points
-            + price_points
-            + accel_points
-            + own_points
-            + rely_points
-            + safety_points
-        )
+            weights.get("fuel_efficiency", 0.0),
+        ),
+        price_fit_score(car.get("price", 0.0), request.budget, weights.get("price_fit", 0.0)),
+        acceleration_score(car.get("zero_to_sixty", 0.0), weights.get("acceleration", 0.0)),
+        ownership_cost_score(car.get("annual_cost", 0.0), weights.get("ownership_cost", 0.0)),
+        reliability_score(car.get("reliability_score", 0.0), weights.get("reliability", 0.0)),
+        safety_score(car.get("safety_score", 0.0), weights.get("safety", 0.0)),
+    )
 
-        results.append(
-            {
-                "id": car.get("id"),
-                "make": car.get("make"),
-                "model": car.get("model"),
-                "year": car.get("year"),
-                "drivetrain": car.get("drivetrain"),
-                "price": car.get("price"),
-                "mpg": car.get("mpg"),
-                "l_per_100km": car.get("l_per_100km"),
-                "fuel_type": car.get("fuel_type"),
-                "zero_to_sixty": car.get("zero_to_sixty"),
-                "annual_cost": car.get("annual_cost"),
-                "reliability_score": car.get("reliability_score"),
-                "safety_score": car.get("safety_score"),
-                "complaints_count": car.get("complaints_count"),
-                "recalls_count": car.get("recalls_count"),
-                "winter_points": round(winter_points, 4),
-                "fuel_points": round(fuel_points, 4),
-                "price_points": round(price_points, 4),
-                "acceleration_points": round(accel_points, 4),
-                "ownership_cost_points": round(own_points, 4),
-                "reliability_points": round(rely_points, 4),
-                "safety_points": round(safety_points, 4),
-                "total_score": round(total_score, 4),
-            }
-        )
 
-    results.sort(key=lambda x: x["total_score"], reverse=True)
+def _total_score(points: Points) -> float:
+    winter_points, fuel_points, price_points, accel_points, own_points, rely_points, safety_points = points
+    return (
+        winter_points
+        + fuel_points
+        + price_points
+        + accel_points
+        + own_points
+        + rely_points
+        + safety_points
+    )
+
+
+def _build_result(car: Dict[str, Any], points: Points) -> Dict[str, Any]:
+    winter_points, fuel_points, price_points, accel_points, own_points, rely_points, safety_points = points
+    total_score = _total_score(points)
     return {
+        "id": car.get("id"),
+        "make": car.get("make"),
+        "model": car.get("model"),
+        "year": car.get("year"),
+        "drivetrain": car.get("drivetrain"),
+        "price": car.get("price"),
+        "mpg": car.get("mpg"),
+        "l_per_100km": car.get("l_per_100km"),
+        "fuel_type": car.get("fuel_type"),
+        "zero_to_sixty": car.get("zero_to_sixty"),
+        "annual_cost": car.get("annual_cost"),
+        "reliability_score": car.get("reliability_score"),
+        "safety_score": car.get("safety_score"),
+        "complaints_count": car.get("complaints_count"),
+        "recalls_count": car.get("recalls_count"),
+        "winter_points": round(winter_points, 4),
+        "fuel_points": round(fuel_points, 4),
+        "price_points": round(price_points, 4),
+        "acceleration_points": round(accel_points, 4),
+        "ownership_cost_points": round(own_points, 4),
+        "reliability_points": round(rely_points, 4),
+        "safety_points": round(safety_points, 4),
+        "total_score": round(total_score, 4),
+    }
+
+
+def _top_scalar(
+    candidates: List[Dict[str, Any]],
+    request: CarRecommendationRequest,
+    weights: Dict[str, float],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    scored = ((car, _score_car(car, request, weights)) for car in candidates)
+    # nlargest() is documented to match sorted(..., reverse=True)[:n], ties included
+    winners = heapq.nlargest(limit, scored, key=lambda item: round(_total_score(item[1]), 4))
+    return [_build_result(car, points) for car, points in winners]
+
+
+def _candidate_rows(columns: CatalogColumns, request: CarRecommendationRequest) -> np.ndarray:
+    return columns.candidate_rows(request.budget * 1.2, request.passengers, request.fuel_type)
+
+
+def _score_columns(
+    columns: CatalogColumns,
+    rows: np.ndarray,
+    request: CarRecommendationRequest,
+    weights: Dict[str, float],
+) -> np.ndarray:
+    """Return a (7, len(rows)) array of points in the same order as `Points`."""
+    feature_weights = np.array([weights.get(name, 0.0) for name in FEATURE_NAMES])
+    weighted = (columns.features[rows] * feature_weights).T
+    winter, fuel, accel, own, rely, safety = weighted
+    price = price_fit_feature_batch(columns.price_for_fit[rows], request.budget) * weights.get("price_fit", 0.0)
+    return np.stack([winter, fuel, price, accel, own, rely, safety])
+
+
+def _top_positions(totals: np.ndarray, limit: int) -> np.ndarray:
+    """
+    Positions of the `limit` best totals, ordered like a stable descending sort on
+    round(total, 4), without sorting the whole array.
+    """
+    if limit < len(totals):
+        kth = np.partition(totals, len(totals) - limit)[len(totals) - limit]
+        candidates = np.flatnonzero(totals >= kth - ROUNDING_SLACK)
+    else:
+        candidates = np.arange(len(totals))
+    keys = [round(total, 4) for total in totals[candidates].tolist()]
+    order = sorted(range(len(candidates)), key=keys.__getitem__, reverse=True)
+    return candidates[order[:limit]]
+
+
+def _top_vectorized(
+    columns: CatalogColumns,
+    request: CarRecommendationRequest,
+    weights: Dict[str, float],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    rows = _candidate_rows(columns, request)
+    if limit <= 0 or not len(rows):
+        return []
+    return _rank_rows(columns, rows, request, weights, limit)
+
+
+def _rank_rows(
+    columns: CatalogColumns,
+    rows: np.ndarray,
+    request: CarRecommendationRequest,
+    weights: Dict[str, float],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Score `rows` exactly and build the results for the best `limit` of them."""
+    points = _score_columns(columns, rows, request, weights)
+    totals = points[0] + points[1] + points[2] + points[3] + points[4] + points[5] + points[6]
+    winners = _top_positions(totals, limit)
+    # tolist() hands back Python floats so round() behaves exactly as on the scalar path
+    return [
+        _build_result(columns.record(row), tuple(row_points))
+        for row, row_points in zip(rows[winners].tolist(), points[:, winners].T.tolist())
+    ]
+
+
+def _cache_key(
+    request: CarRecommendationRequest,
+    weights: Dict[str, float],
+    limit: int,
+    generation: int,
+) -> Tuple[Any, ...]:
+    """
+    Canonical form of everything that affects the response.
+
+    Location, annual_km and priorities do not take part in scoring, and weights that
+    normalize to the same values rank identically, so those requests share an entry.
+    """
+    return (
+        generation,
+        request.budget,
+        request.passengers,
+        request.fuel_type.lower() if request.fuel_type else None,
+        tuple(sorted(weights.items())),
+        limit,
+    )
+
+
+def result_cache_stats() -> Dict[str, Any]:
+    return {**_RESULT_CACHE.stats(), "catalog_generation": _RESULT_CACHE_GENERATION}
+
+
+def build_recommendations(
+    request: CarRecommendationRequest,
+    limit: Optional[int] = 5,
+    vectorized: Optional[bool] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    global _RESULT_CACHE_GENERATION
+
+    raw_weights = request.weights or DEFAULT_WEIGHTS
+    weights = normalize_weights(raw_weights)
+
+    catalog = get_catalog()
+    if use_cache:
+        if catalog.generation != _RESULT_CACHE_GENERATION:
+            # The catalog reloaded: entries for older generations can never hit again
+            _RESULT_CACHE.clear()
+            _RESULT_CACHE_GENERATION = catalog.generation
+        key = _cache_key(request, weights, limit, catalog.generation)
+        cached = _RESULT_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+    if vectorized is None:
+        vectorized = VECTORIZED_SCORING
+    # None and negative limits keep their slicing meaning: rank everything, then slice
+    top = limit if limit is not None and limit >= 0 else len(catalog.cars)
+    if vectorized:
+        results = _top_vectorized(catalog.columns, request, weights, top)
+    else:
+        candidates = catalog.columns.take(_candidate_rows(catalog.columns, request))
+        results = _top_scalar(candidates, request, weights, top)
+
+    response = {
         "weights_used": weights,
-        "using_mock_data": using_mock,
-        "catalog_last_updated": last_updated,
+        "using_mock_data": catalog.using_mock,
+        "catalog_last_updated": catalog.last_updated,
         "results": results[:limit],
     }
+    if use_cache:
+        _RESULT_CACHE.set(key, response)
+    return response
+
+
+def _ranked_positions(totals: np.ndarray) -> Iterator[int]:
+    """
+    Yield every position of `totals` in the order of a stable descending sort on
+    round(total, 4).
+
+    A stable sort on the raw totals is almost that order already: because round() is
+    monotonic, cars that tie after rounding are adjacent, and only need putting back
+    in catalog order within each run.
+    """
+    order = np.argsort(-totals, kind="stable")
+    run: List[int] = []
+    run_key: Optional[float] = None
+    for position, total in zip(order.tolist(), totals[order].tolist()):
+        key = round(total, 4)
+        if key != run_key and run:
+            yield from sorted(run)
+            run = []
+        run_key = key
+        run.append(position)
+    yield from sorted(run)
+
+
+def iter_recommendations(
+    request: CarRecommendationRequest,
+    limit: Optional[int] = None,
+    catalog: Optional[CatalogSnapshot] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield ranked results one by one, in the same order as build_recommendations.
+
+    Only the totals (one float per candidate) are kept for the whole catalog. Result
+    dicts are built STREAM_CHUNK_ROWS at a time as the consumer pulls them, so the
+    first rows can go out before the rest of the ranking is serialized.
+    """
+    weights = normalize_weights(request.weights or DEFAULT_WEIGHTS)
+    catalog = catalog or get_catalog()
+    columns = catalog.columns
+    rows = _candidate_rows(columns, request)
+    if not len(rows) or (limit is not None and limit <= 0):
+        return
+
+    totals = np.empty(len(rows))
+    for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+        points = _score_columns(columns, rows[start : start + STREAM_CHUNK_ROWS], request, weights)
+        # Same summation order as _total_score, so ties break exactly as they do there
+        totals[start : start + STREAM_CHUNK_ROWS] = (
+            points[0] + points[1] + points[2] + points[3] + points[4] + points[5] + points[6]
+        )
+
+    if limit is not None and limit < len(rows):
+        positions: Iterator[int] = iter(_top_positions(totals, limit).tolist())
+    else:
+        positions = _ranked_positions(totals)
+
+    while True:
+        batch = [position for _, position in zip(range(STREAM_CHUNK_ROWS), positions)]
+        if not batch:
+            return
+        batch_rows = rows[batch]
+        points = _score_columns(columns, batch_rows, request, weights)
+        for row, row_points in zip(batch_rows.tolist(), points.T.tolist()):
+            yield _build_result(columns.record(row), tuple(row_points))
+
+
+def build_batch_recommendations(requests: List[CarRecommendationRequest], limit: int = 5) -> Dict[str, Any]:
+    """
+    Recommend for many profiles against a single catalog snapshot.
+
+    Profiles are scored in blocks as one (profiles x features) @ (features x cars)
+    product plus the per-profile price fit. Those approximate totals only narrow each
+    profile down to the cars near its top `limit`; the survivors are then scored exactly
+    like build_recommendations, so every profile gets the same results as a single
+    /recommend call would return.
+    """
+    catalog = get_catalog()
+    columns = catalog.columns
+    weights_list = [normalize_weights(request.weights or DEFAULT_WEIGHTS) for request in requests]
+    feature_weights = np.array(
+        [[weights.get(name, 0.0) for name in FEATURE_NAMES] for weights in weights_list]
+    ).reshape(len(requests), len(FEATURE_NAMES))
+
+    profiles: List[Dict[str, Any]] = []
+    block_size = max(1, BATCH_SCORE_CELLS // max(columns.size, 1))
+    for start in range(0, len(requests), block_size):
+        block = slice(start, start + block_size)
+        approx_totals = feature_weights[block] @ columns.features.T
+        for offset, (request, weights) in enumerate(zip(requests[block], weights_list[block])):
+            rows = _candidate_rows(columns, request)
+            if limit <= 0 or not len(rows):
+                results: List[Dict[str, Any]] = []
+            else:
+                approx = approx_totals[offset, rows] + (
+                    price_fit_feature_batch(columns.price_for_fit[rows], request.budget) * weights.get("price_fit", 0.0)
+                )
+                if limit < len(rows):
+                    kth = np.partition(approx, len(rows) - limit)[len(rows) - limit]
+                    # Matrix products sum in a different order; the extra slack covers it
+                    rows = rows[approx >= kth - 2 * ROUNDING_SLACK]
+                results = _rank_rows(columns, rows, request, weights, limit)
+            profiles.append({"weights_used": weights, "results": results})
+
+    return {
+        "using_mock_data": catalog.using_mock,
+        "catalog_last_updated": catalog.last_updated,
+        "profiles": profiles,
+    }
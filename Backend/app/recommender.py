@@ -1,4 +1,6 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Sequence
+
+import numpy as np
 
 
 def clamp(value: float, lo: float = 0.0, hi: float = 1.0) -> float:
@@ -14,8 +16,8 @@ def normalize_weights(weights: Dict[str, float]) -> Dict[str, float]:
 
 # Winter driving
 
-def winter_feature(drivetrain: str) -> float:
-    d = drivetrain.upper()
+def winter_feature(drivetrain: Optional[str]) -> float:
+    d = (drivetrain or "").upper()
     if d == "AWD":
         return 1.0
     if d == "FWD":
@@ -25,7 +27,7 @@ def winter_feature(drivetrain: str) -> float:
     return 0.5
 
 
-def winter_score(drivetrain: str, weight: float) -> float:
+def winter_score(drivetrain: Optional[str], weight: float) -> float:
     return winter_feature(drivetrain) * weight
 
 
@@ -134,3 +136,60 @@ def safety_feature(score: Optional[float]) -> float:
 
 def safety_score(raw_score: Optional[float], weight: float) -> float:
     return safety_feature(raw_score) * weight
+
+
+# Batch (array-in/array-out) versions of the features above.
+# NaN plays the role of None, and every branch reproduces the scalar arithmetic
+# operation-for-operation so both paths yield identical floats.
+
+def winter_feature_batch(drivetrains: Sequence[Optional[str]]) -> np.ndarray:
+    return np.array([winter_feature(d) for d in drivetrains], dtype=np.float64)
+
+
+def mpg_to_l_per_100km_batch(mpg: np.ndarray) -> np.ndarray:
+    mpg = np.asarray(mpg, dtype=np.float64)
+    valid = mpg > 0
+    out = np.full(mpg.shape, np.nan)
+    np.divide(235.214583, mpg, out=out, where=valid)
+    return out
+
+
+def fuel_feature_batch(l_per_100km: np.ndarray, best: float = 4.0, worst: float = 12.0) -> np.ndarray:
+    l = np.asarray(l_per_100km, dtype=np.float64)
+    scaled = 1.0 - ((l - best) / (worst - best))
+    out = np.where(l <= best, 1.0, np.where(l >= worst, 0.0, scaled))
+    return np.where(np.isnan(l), 0.0, out)
+
+
+def price_fit_feature_batch(price: np.ndarray, budget: float, over_penalty: float = 0.5) -> np.ndarray:
+    price = np.asarray(price, dtype=np.float64)
+    if budget <= 0:
+        return np.zeros(price.shape)
+    over_ratio = (price - budget) / budget
+    over = np.clip(1.0 - over_ratio * over_penalty, 0.0, 1.0)
+    out = np.where(price <= budget, 1.0, over)
+    return np.where(np.isnan(price), 0.0, out)
+
+
+def acceleration_feature_batch(zero_to_sixty: np.ndarray, best: float = 4.0, worst: float = 10.0) -> np.ndarray:
+    t = np.asarray(zero_to_sixty, dtype=np.float64)
+    scaled = 1.0 - ((t - best) / (worst - best))
+    out = np.where(t <= best, 1.0, np.where(t >= worst, 0.0, scaled))
+    return np.where(np.isnan(t), 0.0, out)
+
+
+def ownership_cost_feature_batch(annual_cost: np.ndarray, best: float = 1500.0, worst: float = 5000.0) -> np.ndarray:
+    cost = np.asarray(annual_cost, dtype=np.float64)
+    scaled = (worst - cost) / (worst - best)
+    out = np.where(cost <= best, 1.0, np.where(cost >= worst, 0.0, scaled))
+    return np.where(np.isnan(cost), 0.0, out)
+
+
+def reliability_feature_batch(score: np.ndarray) -> np.ndarray:
+    score = np.asarray(score, dtype=np.float64)
+    return np.where(np.isnan(score), 0.5, np.clip(score, 0.0, 1.0))
+
+
+def safety_feature_batch(score: np.ndarray) -> np.ndarray:
+    score = np.asarray(score, dtype=np.float64)
+    return np.where(np.isnan(score), 0.5, np.clip(score, 0.0, 1.0))
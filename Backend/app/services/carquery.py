@@ -3,8 +3,9 @@ from typing import List, Dict, Any
 
 import requests
 
+from app.services.http_cache import cached_get
+
 BASE_URL = "https://www.carqueryapi.com/api/0.3/"
-TIMEOUT = 10
 
 
 def _parse_json_maybe_jsonp(text: str) -> Any:
@@ -36,10 +37,9 @@ def get_trims(make: str, year: int, sold_in_us: int = 1) -> List[Dict[str, Any]]
     Returns a list of dictionaries with fields like model_name, model_trim, etc.
     """
     try:
-        resp = requests.get(
+        resp = cached_get(
             BASE_URL,
             params={"cmd": "getTrims", "make": make, "year": year, "sold_in_us": sold_in_us},
-            timeout=TIMEOUT,
         )
         resp.raise_for_status()
     except requests.RequestException:
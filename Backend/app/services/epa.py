@@ -3,13 +3,14 @@ from typing import List, Dict, Optional
 
 import requests
 
+from app.services.http_cache import cached_get
+
 BASE_URL = "https://api.fueleconomy.gov/ws/rest"
-TIMEOUT = 8
 
 
 def _fetch_xml(path: str, params: Dict) -> Optional[ET.Element]:
     try:
-        resp = requests.get(f"{BASE_URL}/{path}", params=params, timeout=TIMEOUT)
+        resp = cached_get(f"{BASE_URL}/{path}", params=params)
         resp.raise_for_status()
         return ET.fromstring(resp.text)
     except (requests.RequestException, ET.ParseError):
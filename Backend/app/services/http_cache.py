@@ -0,0 +1,248 @@
+"""
+On-disk cache of raw HTTP responses shared by the CarQuery, EPA and NHTSA clients.
+
+Responses are stored content-addressed by a hash of the URL and its query parameters,
+one file per response under HTTP_CACHE_DIR/<host>/. HTTP_CACHE_MODE selects how the
+cache is used:
+
+- ``record`` (default): serve fresh entries, fetch and store everything else.
+- ``replay``: serve only from the cache, whatever the entry's age; a miss raises
+  ReplayMiss instead of touching the network. Useful for offline, repeatable sync
+  runs, benchmarks and tests.
+- ``off``: always fetch and store nothing.
+
+The cache is capped at HTTP_CACHE_MAX_MB: once the responses recorded since the last
+sweep add up to a tenth of the cap, the oldest-recorded files are deleted until the
+cache is back under 90% of it. Age alone never evicts, since replay runs need old
+entries.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode, urlsplit
+
+import requests
+
+from app.services import http_client
+
+CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", Path(__file__).resolve().parent.parent / "data" / "cache" / "http"))
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODE = os.getenv("HTTP_CACHE_MODE", MODE_RECORD).lower()
+# Size cap of the cache directory; 0 disables eviction
+MAX_BYTES = int(float(os.getenv("HTTP_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# A sweep brings the cache down to this share of the cap
+SWEEP_TARGET = 0.9
+
+DAY = 86400
+# How long a recorded response stays fresh, per host
+HOST_TTLS: Dict[str, float] = {
+    "www.carqueryapi.com": 30 * DAY,
+    "api.fueleconomy.gov": 30 * DAY,
+    "api.nhtsa.gov": 30 * DAY,
+}
+DEFAULT_TTL = 1 * DAY
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "replay_misses": 0, "evicted": 0}
+
+_sweep_lock = threading.Lock()
+# Bytes stored since the last sweep; None until the first store triggers one
+_stored_since_sweep: Optional[int] = None
+
+
+class ReplayMiss(requests.RequestException):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+class CachedResponse:
+    """The parts of a response the service clients use, whether fetched or replayed."""
+
+    def __init__(self, url: str, status_code: int, text: str, from_cache: bool = False) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.from_cache = from_cache
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} error for url: {self.url}", response=self)
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of the request URL with its parameters in a canonical order."""
+    query = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha256(f"GET {url}?{query}".encode("utf-8")).hexdigest()
+
+
+def _entry_path(url: str, key: str) -> Path:
+    host = urlsplit(url).netloc.replace(":", "_") or "_"
+    return CACHE_DIR / host / key[:2] / f"{key}.json"
+
+
+def _ttl_for(url: str) -> float:
+    return HOST_TTLS.get(urlsplit(url).hostname or "", DEFAULT_TTL)
+
+
+def lookup(url: str, params: Optional[Dict[str, Any]] = None) -> Optional[CachedResponse]:
+    """Return the recorded response if there is one that the current mode may serve."""
+    if MODE == MODE_OFF:
+        return None
+    path = _entry_path(url, cache_key(url, params))
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if MODE != MODE_REPLAY and time.time() - entry.get("fetched_at", 0) >= _ttl_for(url):
+        return None
+    return CachedResponse(url, entry["status_code"], entry["text"], from_cache=True)
+
+
+def store(url: str, params: Optional[Dict[str, Any]], response: CachedResponse) -> None:
+    """Record a successful response; errors are never cached."""
+    if MODE == MODE_OFF or not (200 <= response.status_code < 300):
+        return
+    path = _entry_path(url, cache_key(url, params))
+    entry = {
+        "url": url,
+        "params": {str(k): str(v) for k, v in (params or {}).items()},
+        "status_code": response.status_code,
+        "text": response.text,
+        "fetched_at": time.time(),
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(entry, f)
+            size = f.tell()
+        os.replace(tmp_path, path)
+        _count("stores")
+    except OSError:
+        return  # Caching is best effort
+    _maybe_sweep(size)
+
+
+def _maybe_sweep(stored: int) -> None:
+    """Sweep on the first store of the process and then every tenth of the cap stored."""
+    global _stored_since_sweep
+    if not MAX_BYTES:
+        return
+    with _stats_lock:
+        due = _stored_since_sweep is None or _stored_since_sweep + stored >= MAX_BYTES // 10
+        _stored_since_sweep = 0 if due else _stored_since_sweep + stored
+    # One sweeper at a time; the others carry on storing
+    if due and _sweep_lock.acquire(blocking=False):
+        try:
+            sweep()
+        finally:
+            _sweep_lock.release()
+
+
+def sweep(max_bytes: Optional[int] = None) -> int:
+    """
+    Delete the oldest-recorded responses while the cache is over `max_bytes` (default
+    MAX_BYTES), down to SWEEP_TARGET of it. Returns how many files were deleted.
+    """
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for path in CACHE_DIR.glob("*/*/*.json"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue  # Replaced or deleted meanwhile
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    if total <= max_bytes:
+        return 0
+
+    entries.sort(key=lambda entry: entry[0])
+    evicted = 0
+    for _, size, path in entries:
+        if total <= max_bytes * SWEEP_TARGET:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    with _stats_lock:
+        _stats["evicted"] += evicted
+    return evicted
+
+
+def _before_fetch(url: str, params: Optional[Dict[str, Any]], use_cache: bool) -> Optional[CachedResponse]:
+    # Replay serves from the cache even when the caller asked for fresh data
+    if use_cache or MODE == MODE_REPLAY:
+        cached = lookup(url, params)
+        if cached is not None:
+            _count("hits")
+            return cached
+    if MODE == MODE_REPLAY:
+        _count("replay_misses")
+        raise ReplayMiss(f"No recorded response for {url} {params or {}}")
+    _count("misses")
+    return None
+
+
+def cached_get(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    use_cache: bool = True,
+) -> CachedResponse:
+    """
+    GET through the response cache. `use_cache=False` skips the lookup but still
+    records the fresh response.
+    """
+    cached = _before_fetch(url, params, use_cache)
+    if cached is not None:
+        return cached
+    resp = http_client.get(url, params=params, timeout=timeout)
+    response = CachedResponse(url, resp.status_code, resp.text)
+    store(url, params, response)
+    return response
+
+
+async def cached_get_async(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+) -> CachedResponse:
+    """Async version of cached_get; cache files are read and written in a worker thread."""
+    cached = await asyncio.to_thread(_before_fetch, url, params, use_cache)
+    if cached is not None:
+        return cached
+    resp = await http_client.get_async(url, params=params)
+    response = CachedResponse(url, resp.status_code, resp.text)
+    await asyncio.to_thread(store, url, params, response)
+    return response
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return {"mode": MODE, "dir": str(CACHE_DIR), "max_bytes": MAX_BYTES, **_stats}
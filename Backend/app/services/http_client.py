@@ -0,0 +1,257 @@
+"""
+Shared HTTP client for the CarQuery, EPA and NHTSA services.
+
+Every host gets a keep-alive connection pool (a requests.Session for sync callers, an
+httpx.AsyncClient per event loop for async ones), a cap on concurrent requests, and
+a timeout. 429 and 5xx responses, timeouts and connection errors are retried with
+jittered exponential backoff, up to the host's `max_retries`. NHTSA is called while
+serving requests and is not retried there; batch scripts raise its retries with
+`configure_host`. Latency histograms and error counters are kept per
+host and exposed through `stats()`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass(frozen=True)
+class HostConfig:
+    timeout: float = 10.0
+    max_concurrency: int = 4
+    max_retries: int = 2
+
+
+HOSTS: Dict[str, HostConfig] = {
+    "www.carqueryapi.com": HostConfig(timeout=10.0, max_concurrency=2),
+    "api.fueleconomy.gov": HostConfig(timeout=8.0, max_concurrency=4),
+    # NHTSA is called while serving requests: one attempt, and its circuit breaker handles outages
+    "api.nhtsa.gov": HostConfig(timeout=6.0, max_concurrency=4, max_retries=0),
+}
+DEFAULT_HOST = HostConfig()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+# Keep-alive connections per host for the async clients
+ASYNC_MAX_KEEPALIVE = 10
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def host_config(url: str) -> HostConfig:
+    return HOSTS.get(urlsplit(url).hostname or "", DEFAULT_HOST)
+
+
+def configure_host(url: str, **changes: Any) -> None:
+    """Override settings of `url`'s host for this process; call before its first request."""
+    with _lock:
+        HOSTS[urlsplit(url).hostname or ""] = replace(host_config(url), **changes)
+
+
+class _HostMetrics:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.retries = 0
+        self.errors: Dict[str, int] = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.in_flight = 0
+
+    def observe(self, elapsed_ms: float) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        observed = sum(self.buckets)
+        labels = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["gt_10000ms"]
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "errors": dict(self.errors),
+            "latency_ms": {
+                "count": observed,
+                "mean": round(self.total_ms / observed, 1) if observed else None,
+                "max": round(self.max_ms, 1) if observed else None,
+                "histogram": dict(zip(labels, self.buckets)),
+            },
+        }
+
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_metrics: Dict[str, _HostMetrics] = {}
+# Async clients and semaphores are bound to the event loop they were created on
+_async_clients: Dict[Tuple[asyncio.AbstractEventLoop, str], httpx.AsyncClient] = {}
+_async_semaphores: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Semaphore] = {}
+
+
+def _metrics_for(host: str) -> _HostMetrics:
+    metrics = _metrics.get(host)
+    if metrics is None:
+        metrics = _metrics[host] = _HostMetrics()
+    return metrics
+
+
+def _session_for(url: str) -> Tuple[requests.Session, threading.BoundedSemaphore]:
+    host = _host(url)
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            config = host_config(url)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.max_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+            _semaphores[host] = threading.BoundedSemaphore(config.max_concurrency)
+        return session, _semaphores[host]
+
+
+def _async_client_for(url: str) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+    host = _host(url)
+    key = (asyncio.get_running_loop(), host)
+    with _lock:
+        client = _async_clients.get(key)
+        if client is None or client.is_closed:
+            config = host_config(url)
+            client = _async_clients[key] = httpx.AsyncClient(
+                timeout=config.timeout,
+                limits=httpx.Limits(
+                    max_connections=config.max_concurrency,
+                    max_keepalive_connections=min(config.max_concurrency, ASYNC_MAX_KEEPALIVE),
+                ),
+            )
+            _async_semaphores[key] = asyncio.Semaphore(config.max_concurrency)
+        return client, _async_semaphores[key]
+
+
+def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it gives one."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+def _record(host: str, elapsed_ms: float, error: Optional[str] = None, retry: bool = False) -> None:
+    with _lock:
+        metrics = _metrics_for(host)
+        metrics.requests += 1
+        metrics.observe(elapsed_ms)
+        if error is not None:
+            metrics.errors[error] = metrics.errors.get(error, 0) + 1
+        if retry:
+            metrics.retries += 1
+
+
+def _track_in_flight(host: str, delta: int) -> None:
+    with _lock:
+        _metrics_for(host).in_flight += delta
+
+
+def get(url: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> requests.Response:
+    """
+    GET `url` over the host's pooled session, retrying throttled and failed attempts.
+
+    Returns the last response (which may still be a 429/5xx once retries run out) and
+    raises requests.RequestException if the final attempt could not connect.
+    """
+    host = _host(url)
+    config = host_config(url)
+    session, semaphore = _session_for(url)
+    attempt = 0
+    while True:
+        last_attempt = attempt >= config.max_retries
+        start = time.perf_counter()
+        with semaphore:
+            _track_in_flight(host, 1)
+            try:
+                resp = session.get(url, params=params, timeout=timeout or config.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                _record(host, (time.perf_counter() - start) * 1000, type(e).__name__, retry=not last_attempt)
+                if last_attempt:
+                    raise
+                retry_after = None
+            else:
+                failed = resp.status_code >= 400
+                retry = resp.status_code in RETRY_STATUSES and not last_attempt
+                _record(host, (time.perf_counter() - start) * 1000, str(resp.status_code) if failed else None, retry)
+                if not retry:
+                    return resp
+                retry_after = resp.headers.get("Retry-After")
+            finally:
+                _track_in_flight(host, -1)
+        time.sleep(_backoff(attempt, retry_after))
+        attempt += 1
+
+
+async def get_async(url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+    """Async version of `get`, over a pooled httpx.AsyncClient for the running loop."""
+    host = _host(url)
+    config = host_config(url)
+    client, semaphore = _async_client_for(url)
+    attempt = 0
+    while True:
+        last_attempt = attempt >= config.max_retries
+        start = time.perf_counter()
+        async with semaphore:
+            _track_in_flight(host, 1)
+            try:
+                resp = await client.get(url, params=params)
+            except httpx.TransportError as e:
+                _record(host, (time.perf_counter() - start) * 1000, type(e).__name__, retry=not last_attempt)
+                if last_attempt:
+                    raise
+                retry_after = None
+            else:
+                failed = resp.status_code >= 400
+                retry = resp.status_code in RETRY_STATUSES and not last_attempt
+                _record(host, (time.perf_counter() - start) * 1000, str(resp.status_code) if failed else None, retry)
+                if not retry:
+                    return resp
+                retry_after = resp.headers.get("Retry-After")
+            finally:
+                _track_in_flight(host, -1)
+        await asyncio.sleep(_backoff(attempt, retry_after))
+        attempt += 1
+
+
+async def close_async_clients() -> None:
+    """Close the async clients created on the running loop (called on app shutdown)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        keys = [key for key in _async_clients if key[0] is loop]
+        clients = [_async_clients.pop(key) for key in keys]
+        for key in keys:
+            _async_semaphores.pop(key, None)
+    for client in clients:
+        await client.aclose()
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {host: metrics.snapshot() for host, metrics in _metrics.items()}
@@ -1,49 +1,99 @@
+import asyncio
+import os
+import threading
 import requests
-import json
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Set, Tuple
+from datetime import datetime
 
-BASE = "https://api.nhtsa.gov"
+from app.cache import LRUCache
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.http_cache import ReplayMiss, cached_get, cached_get_async
+from app.services.nhtsa_store import NHTSAStore
+from app.services.singleflight import SingleFlight
+
+BASE = os.getenv("NHTSA_BASE_URL", "https://api.nhtsa.gov")
 
 # Cache directory for NHTSA data
 CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache"
-NHTSA_CACHE_FILE = CACHE_DIR / "nhtsa_cache.json"
+NHTSA_DB_FILE = CACHE_DIR / "nhtsa_cache.sqlite3"
+NHTSA_CACHE_FILE = CACHE_DIR / "nhtsa_cache.json"  # Legacy cache, imported once
 CACHE_DURATION_DAYS = 30  # Cache NHTSA data for 30 days
+# Expired entries can still be served stale; after this long they are deleted
+STALE_RETENTION_DAYS = float(os.getenv("NHTSA_STALE_RETENTION_DAYS", "90"))
 
+_store: Optional[NHTSAStore] = None
+_store_lock = threading.Lock()
 
-def _load_cache() -> Dict[str, Any]:
-    """Load NHTSA cache from disk."""
-    if NHTSA_CACHE_FILE.exists():
-        try:
-            with NHTSA_CACHE_FILE.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except (OSError, json.JSONDecodeError):
-            pass
-    return {}
+# In-flight lookups, keyed on the cache key
+_flights = SingleFlight()
 
+# Fail fast while the API keeps failing, and answer recently failed lookups from memory
+# instead of retrying them on every request
+_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+NEGATIVE_CACHE_SECONDS = 60
+_negative_cache = LRUCache(1024, ttl=NEGATIVE_CACHE_SECONDS)
 
-def _save_cache(cache: Dict[str, Any]) -> None:
-    """Save NHTSA cache to disk."""
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    try:
-        with NHTSA_CACHE_FILE.open("w", encoding="utf-8") as f:
-            json.dump(cache, f, indent=2)
-    except OSError:
-        pass  # Fail silently if we can't write cache
+# Expired entries are served as they are while this pool fetches fresh data
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="nhtsa-refresh")
+_refresh_lock = threading.Lock()
+_refreshing: Set[str] = set()
+_refresh_counts = {"scheduled": 0, "succeeded": 0, "failed": 0}
 
 
-def _get_count(url: str, params: dict) -> int:
-    """Fetch count of results from NHTSA endpoint."""
-    r = requests.get(url, params=params, timeout=6)
-    r.raise_for_status()
-    data = r.json()
+def get_store() -> NHTSAStore:
+    """
+    Open the NHTSA store on first use, migrating the old JSON cache into it and purging
+    entries expired for longer than STALE_RETENTION_DAYS.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = NHTSAStore(
+                    NHTSA_DB_FILE,
+                    ttl_seconds=CACHE_DURATION_DAYS * 86400,
+                    legacy_json=NHTSA_CACHE_FILE,
+                    retention_seconds=STALE_RETENTION_DAYS * 86400,
+                )
+    return _store
 
+
+def nhtsa_stats() -> Dict[str, Any]:
+    """Counters for the NHTSA store and for lookups coalesced while in flight."""
+    with _refresh_lock:
+        refresh = {**_refresh_counts, "in_progress": len(_refreshing)}
+    return {
+        "store": get_store().stats(),
+        "singleflight": _flights.stats(),
+        "circuit_breaker": _breaker.stats(),
+        "negative_cache": _negative_cache.stats(),
+        "refresh": refresh,
+    }
+
+
+def _results_count(data: Dict[str, Any]) -> int:
     # Most NHTSA endpoints include "results" as a list
     results = data.get("results", [])
     return len(results)
 
 
+def _get_count(url: str, params: dict, use_cache: bool = True) -> int:
+    """Fetch count of results from NHTSA endpoint."""
+    r = cached_get(url, params=params, use_cache=use_cache)
+    r.raise_for_status()
+    return _results_count(r.json())
+
+
+async def _get_count_async(url: str, params: dict, use_cache: bool = True) -> int:
+    """Async version of _get_count."""
+    r = await cached_get_async(url, params=params, use_cache=use_cache)
+    r.raise_for_status()
+    return _results_count(r.json())
+
+
 def calculate_reliability_from_nhtsa(
     complaints_count: int, 
     recalls_count: int,
@@ -105,11 +155,126 @@ def calculate_safety_score(recalls_count: int, vehicle_age_years: int = 0) -> fl
     return max(0.4, min(1.0, safety))
 
 
+def vehicle_cache_key(model_year: int, make: str, model: str) -> str:
+    return f"{model_year}_{make}_{model}".lower().replace(" ", "_")
+
+
+def get_cached_complaints_and_recalls(model_year: int, make: str, model: str) -> Optional[dict]:
+    """Return the stored result for a vehicle without calling the API."""
+    return _read_cached(vehicle_cache_key(model_year, make, model))
+
+
+def _read_cached(cache_key: str) -> Optional[dict]:
+    """Return the cached result for `cache_key` if it is still fresh."""
+    return get_store().get(cache_key)
+
+
+def _write_cached(cache_key: str, result: dict) -> None:
+    get_store().set(cache_key, result)
+
+
+def _cached_or_failed(
+    model_year: int, make: str, model: str, cache_key: str, allow_stale: bool = True
+) -> Optional[dict]:
+    """
+    Answer from the store or the negative cache without calling the API.
+
+    With `allow_stale`, an expired entry is still returned and a background refresh
+    is scheduled for it.
+    """
+    entry = get_store().lookup(cache_key)
+    if entry is not None:
+        data, fresh = entry
+        if fresh:
+            return data
+        if allow_stale:
+            _schedule_refresh(model_year, make, model, cache_key)
+            return data
+    return _negative_cache.get(cache_key)
+
+
+def _schedule_refresh(model_year: int, make: str, model: str, cache_key: str) -> bool:
+    with _refresh_lock:
+        if cache_key in _refreshing:
+            return False
+        _refreshing.add(cache_key)
+        _refresh_counts["scheduled"] += 1
+    _refresh_pool.submit(_refresh, model_year, make, model, cache_key)
+    return True
+
+
+def _refresh(model_year: int, make: str, model: str, cache_key: str) -> None:
+    outcome = "failed"
+    try:
+        # Past the HTTP response cache too, or stale data could come back stamped fresh
+        result = refresh_complaints_and_recalls(model_year, make, model)
+        if "error" not in result:
+            outcome = "succeeded"
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(cache_key)
+            _refresh_counts[outcome] += 1
+
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    """Whether an error says the API itself is unhealthy (not a bad request or replay miss)."""
+    if isinstance(exc, ReplayMiss):
+        return False
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is None or status >= 500 or status == 429
+
+
+def _record_failure(cache_key: str, exc: Exception, result: dict) -> dict:
+    if _is_upstream_failure(exc):
+        _breaker.record_failure()
+    else:
+        _breaker.record_success()
+    _negative_cache.set(cache_key, result)
+    return result
+
+
+def _endpoints(model_year: int, make: str, model: str) -> Tuple[str, str, dict]:
+    params = {"make": make, "model": model, "modelYear": model_year}
+    return f"{BASE}/complaints/complaintsByVehicle", f"{BASE}/recalls/recallsByVehicle", params
+
+
+def _unavailable(model_year: int, make: str, model: str) -> dict:
+    return {
+        "error": "NHTSA service unavailable",
+        "model_year": model_year,
+        "make": make,
+        "model": model,
+    }
+
+
+def _build_result(model_year: int, make: str, model: str, complaints: int, recalls: int) -> dict:
+    # Calculate age
+    current_year = datetime.now().year
+    vehicle_age = max(1, current_year - model_year)
+    
+    # Calculate scores
+    reliability = calculate_reliability_from_nhtsa(complaints, recalls, vehicle_age)
+    safety = calculate_safety_score(recalls, vehicle_age)
+    
+    result = {
+        "model_year": model_year,
+        "make": make,
+        "model": model,
+        "complaints_count": complaints,
+        "recalls_count": recalls,
+        "vehicle_age_years": vehicle_age,
+        "reliability_score": round(reliability, 3),
+        "safety_score": round(safety, 3),
+    }
+    return result
+
+
 def get_complaints_and_recalls(
     model_year: int, 
     make: str, 
     model: str,
-    use_cache: bool = True
+    use_cache: bool = True,
+    allow_stale: bool = True
 ) -> dict:
     """
     Fetch complaint and recall counts from NHTSA API with caching.
@@ -119,60 +284,110 @@ def get_complaints_and_recalls(
         make: Vehicle make (e.g., "Toyota")
         model: Vehicle model (e.g., "Camry")
         use_cache: Whether to use cached data
+        allow_stale: Return expired cached data at once and refresh it in the background
     
     Returns:
         Dictionary with complaints, recalls, and calculated scores
     """
-    cache_key = f"{model_year}_{make}_{model}".lower().replace(" ", "_")
+    cache_key = vehicle_cache_key(model_year, make, model)
     
     # Check cache first
     if use_cache:
-        cache = _load_cache()
-        if cache_key in cache:
-            cached_data = cache[cache_key]
-            cached_time = datetime.fromisoformat(cached_data.get("cached_at", "2000-01-01"))
-            if datetime.now() - cached_time < timedelta(days=CACHE_DURATION_DAYS):
-                return cached_data["data"]
+        cached = _cached_or_failed(model_year, make, model, cache_key, allow_stale)
+        if cached is not None:
+            return cached
     
-    params = {"make": make, "model": model, "modelYear": model_year}
+    # Concurrent misses for the same vehicle share one fetch
+    return _flights.do(cache_key, lambda: _fetch(model_year, make, model, cache_key, use_cache))
+
+
+def _fetch(model_year: int, make: str, model: str, cache_key: str, use_cache: bool) -> dict:
+    if use_cache:
+        # A flight that finished just before this one started may have stored the answer
+        cached = _cached_or_failed(model_year, make, model, cache_key, allow_stale=False)
+        if cached is not None:
+            return cached
+    if not _breaker.allow():
+        return _unavailable(model_year, make, model)
+    
+    complaints_url, recalls_url, params = _endpoints(model_year, make, model)
     
     try:
-        complaints = _get_count(f"{BASE}/complaints/complaintsByVehicle", params)
-        recalls = _get_count(f"{BASE}/recalls/recallsByVehicle", params)
-    except requests.RequestException as e:
-        return {
-            "error": "NHTSA service unavailable",
-            "model_year": model_year,
-            "make": make,
-            "model": model,
-        }
+        complaints = _get_count(complaints_url, params, use_cache)
+        recalls = _get_count(recalls_url, params, use_cache)
+    except (requests.RequestException, ValueError) as e:
+        return _record_failure(cache_key, e, _unavailable(model_year, make, model))
+    _breaker.record_success()
     
-    # Calculate age
-    current_year = datetime.now().year
-    vehicle_age = max(1, current_year - model_year)
+    result = _build_result(model_year, make, model, complaints, recalls)
     
-    # Calculate scores
-    reliability = calculate_reliability_from_nhtsa(complaints, recalls, vehicle_age)
-    safety = calculate_safety_score(recalls, vehicle_age)
+    # Save to cache
+    if use_cache:
+        _write_cached(cache_key, result)
     
-    result = {
-        "model_year": model_year,
-        "make": make,
-        "model": model,
-        "complaints_count": complaints,
-        "recalls_count": recalls,
-        "vehicle_age_years": vehicle_age,
-        "reliability_score": round(reliability, 3),
-        "safety_score": round(safety, 3),
-    }
+    return result
+
+
+def refresh_complaints_and_recalls(model_year: int, make: str, model: str) -> dict:
+    """
+    Fetch current counts past every cache and store them; used to refresh entries
+    before they expire.
+    """
+    cache_key = vehicle_cache_key(model_year, make, model)
+    result = _flights.do(cache_key, lambda: _fetch(model_year, make, model, cache_key, False))
+    if "error" not in result:
+        _write_cached(cache_key, result)
+    return result
+
+
+async def get_complaints_and_recalls_async(
+    model_year: int,
+    make: str,
+    model: str,
+    use_cache: bool = True
+) -> dict:
+    """
+    Async version of get_complaints_and_recalls.
     
-    # Save to cache
+    Complaints and recalls are fetched concurrently over the shared async client;
+    the store is read and written in a worker thread. Expired entries are always
+    served stale while they refresh.
+    """
+    cache_key = vehicle_cache_key(model_year, make, model)
+    
+    if use_cache:
+        cached = await asyncio.to_thread(_cached_or_failed, model_year, make, model, cache_key)
+        if cached is not None:
+            return cached
+    
+    return await _flights.do_async(
+        cache_key, lambda: _fetch_async(model_year, make, model, cache_key, use_cache)
+    )
+
+
+async def _fetch_async(model_year: int, make: str, model: str, cache_key: str, use_cache: bool) -> dict:
     if use_cache:
-        cache = _load_cache()
-        cache[cache_key] = {
-            "data": result,
-            "cached_at": datetime.now().isoformat(),
-        }
-        _save_cache(cache)
-    
-    return result
\ No newline at end of file
+        # A flight that finished just before this one started may have stored the answer
+        cached = await asyncio.to_thread(_cached_or_failed, model_year, make, model, cache_key, False)
+        if cached is not None:
+            return cached
+    if not _breaker.allow():
+        return _unavailable(model_year, make, model)
+    
+    complaints_url, recalls_url, params = _endpoints(model_year, make, model)
+    
+    try:
+        complaints, recalls = await asyncio.gather(
+            _get_count_async(complaints_url, params, use_cache),
+            _get_count_async(recalls_url, params, use_cache),
+        )
+    except (requests.RequestException, httpx.HTTPError, ValueError) as e:
+        return _record_failure(cache_key, e, _unavailable(model_year, make, model))
+    _breaker.record_success()
+    
+    result = _build_result(model_year, make, model, complaints, recalls)
+    
+    if use_cache:
+        await asyncio.to_thread(_write_cached, cache_key, result)
+    
+    return result
@@ -0,0 +1,178 @@
+"""
+Background refresh of NHTSA store entries before they expire.
+
+Without it an entry is only found to be stale when a user asks for it. The scheduler
+runs in the API process: every NHTSA_REFRESH_INTERVAL seconds it lists entries that
+expire within NHTSA_REFRESH_WINDOW_DAYS (or already have), puts vehicles in the live
+catalog first, and refreshes them until that cycle's share of NHTSA_REFRESH_BUDGET
+(upstream requests per hour; 0 disables the scheduler) is spent. Each cycle first
+purges entries expired for longer than NHTSA_STALE_RETENTION_DAYS, so the store does
+not grow without bound in a long-running process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.data.catalog import get_catalog
+from app.services.nhtsa_issues import (
+    STALE_RETENTION_DAYS,
+    get_store,
+    refresh_complaints_and_recalls,
+    vehicle_cache_key,
+)
+from app.services.rate_limit import TokenBucket
+
+DAY = 86400
+REFRESH_BUDGET = float(os.getenv("NHTSA_REFRESH_BUDGET", "120"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("NHTSA_REFRESH_INTERVAL", "300"))
+REFRESH_WINDOW_DAYS = float(os.getenv("NHTSA_REFRESH_WINDOW_DAYS", "3"))
+# Let the app finish starting before the first cycle
+STARTUP_DELAY_SECONDS = 30.0
+
+# Each refresh makes two API calls (complaints + recalls)
+CALLS_PER_LOOKUP = 2
+
+Vehicle = Tuple[int, str, str]
+
+
+def catalog_vehicles() -> Dict[str, Vehicle]:
+    """(year, make, model) of every vehicle in the live catalog, by NHTSA cache key."""
+    return {
+        vehicle_cache_key(entry["year"], entry["make"], entry["model"]): (entry["year"], entry["make"], entry["model"])
+        for entry in get_catalog().models
+    }
+
+
+class RefreshScheduler:
+    """
+    Refresh expiring NHTSA entries within an hourly request budget.
+
+    The budget is a token bucket holding at most one interval's worth of requests, so
+    idle cycles do not save up for a burst. A cycle stops at its first failed refresh
+    and leaves the rest for the next one.
+    """
+
+    def __init__(
+        self,
+        budget_per_hour: float = REFRESH_BUDGET,
+        interval: float = REFRESH_INTERVAL_SECONDS,
+        window_seconds: float = REFRESH_WINDOW_DAYS * DAY,
+        retention_seconds: float = STALE_RETENTION_DAYS * DAY,
+        vehicles: Callable[[], Dict[str, Vehicle]] = catalog_vehicles,
+        refresh: Callable[[int, str, str], Dict[str, Any]] = refresh_complaints_and_recalls,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.budget_per_hour = budget_per_hour
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.retention_seconds = retention_seconds
+        self._vehicles = vehicles
+        self._refresh = refresh
+        self._clock = clock
+        self._bucket = (
+            TokenBucket(budget_per_hour / 3600, capacity=max(CALLS_PER_LOOKUP, budget_per_hour * interval / 3600))
+            if self.enabled
+            else None
+        )
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._counts = {"cycles": 0, "refreshed": 0, "failed": 0, "purged": 0}
+        self._backlog = {"total": 0, "in_catalog": 0, "expired": 0}
+        self._last_cycle: Optional[Dict[str, Any]] = None
+        self._last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_per_hour > 0
+
+    def plan(self) -> List[Tuple[str, Vehicle]]:
+        """Entries to refresh, catalog vehicles first, each group soonest-expiring first."""
+        now = self._clock()
+        catalog = self._vehicles()
+        entries = get_store().expiring(now + self.window_seconds)
+        candidates = []
+        for key, data, expires_at in entries:
+            vehicle = catalog.get(key)
+            if vehicle is None:
+                try:
+                    vehicle = (int(data["model_year"]), data["make"], data["model"])
+                except (KeyError, TypeError, ValueError):
+                    continue  # Not enough to look the vehicle up again
+            candidates.append((key not in catalog, expires_at, key, vehicle))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        with self._lock:
+            self._backlog = {
+                "total": len(candidates),
+                "in_catalog": sum(not c[0] for c in candidates),
+                "expired": sum(c[1] <= now for c in candidates),
+            }
+        return [(key, vehicle) for _, _, key, vehicle in candidates]
+
+    def run_once(self) -> Dict[str, Any]:
+        """Run one cycle and return what it did."""
+        started = self._clock()
+        refreshed = failed = 0
+        purged = get_store().purge_expired(started - self.retention_seconds)
+        planned = self.plan()
+        for _, (year, make, model) in planned:
+            if self._stopping.is_set() or not self._bucket.try_acquire(CALLS_PER_LOOKUP):
+                break
+            if "error" in self._refresh(year, make, model):
+                failed += 1
+                break
+            refreshed += 1
+        remaining = len(planned) - refreshed
+
+        cycle = {
+            "started_at": datetime.fromtimestamp(started).isoformat(),
+            "duration_seconds": round(self._clock() - started, 3),
+            "refreshed": refreshed,
+            "failed": failed,
+            "remaining": remaining,
+            "purged": purged,
+        }
+        with self._lock:
+            self._counts["cycles"] += 1
+            self._counts["refreshed"] += refreshed
+            self._counts["failed"] += failed
+            self._counts["purged"] += purged
+            self._last_cycle = cycle
+        return cycle
+
+    async def run(self) -> None:
+        """Run cycles every `interval` seconds until cancelled or stopped."""
+        self._stopping.clear()
+        await asyncio.sleep(STARTUP_DELAY_SECONDS)
+        while not self._stopping.is_set():
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                with self._lock:
+                    self._last_error = f"{type(e).__name__}: {e}"
+            await asyncio.sleep(self.interval)
+
+    def stop(self) -> None:
+        """Ask a running cycle to stop after its current refresh."""
+        self._stopping.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "budget_per_hour": self.budget_per_hour,
+                "interval_seconds": self.interval,
+                "window_days": self.window_seconds / DAY,
+                **self._counts,
+                "backlog": dict(self._backlog),
+                "last_cycle": self._last_cycle,
+                "last_error": self._last_error,
+            }
+
+
+scheduler = RefreshScheduler()
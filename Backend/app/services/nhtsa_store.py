@@ -0,0 +1,168 @@
+"""
+Persistent keyed store for NHTSA lookups.
+
+Entries live in a SQLite database in WAL mode, so lookups are indexed by cache key and
+concurrent writers (API workers, enrichment scripts) do not overwrite each other. A
+small in-process LRU sits in front of it for hot keys.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache import LRUCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nhtsa_cache (
+    cache_key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    cached_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nhtsa_cache_expires_at ON nhtsa_cache (expires_at);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# How long a writer waits for another process holding the write lock
+BUSY_TIMEOUT_SECONDS = 10.0
+
+
+class NHTSAStore:
+    """
+    Key/value store of NHTSA results with a per-entry expiry time.
+
+    Each thread gets its own SQLite connection. The first open imports the legacy JSON
+    cache (`legacy_json`) once; entries keep their original `cached_at` time, so they
+    expire when they would have under the old cache. Expired entries are kept (they
+    can still be served stale) until `retention_seconds` after they expired; every open
+    purges the older ones, and long-running processes call purge_expired() as well.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl_seconds: float,
+        lru_size: int = 2048,
+        legacy_json: Optional[Path] = None,
+        retention_seconds: Optional[float] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._lru = LRUCache(lru_size)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        if legacy_json is not None:
+            self._migrate_json(Path(legacy_json))
+        if retention_seconds is not None:
+            self.purge_expired(time.time() - retention_seconds)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored data for `key`, or None if it is missing or expired."""
+        entry = self.lookup(key)
+        if entry is None or not entry[1]:
+            return None
+        return entry[0]
+
+    def lookup(self, key: str) -> Optional[Tuple[Dict[str, Any], bool]]:
+        """Return the stored data for `key` and whether it is still fresh, even if expired."""
+        data = self._lru.get(key)
+        if data is not None:
+            return data, True
+        row = self._connect().execute(
+            "SELECT data, expires_at FROM nhtsa_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        now = time.time()
+        if row[1] <= now:
+            return data, False
+        self._lru.set(key, data, ttl=row[1] - now)
+        return data, True
+
+    def set(self, key: str, data: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl is None else ttl
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO nhtsa_cache (cache_key, data, cached_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(data), now, now + ttl),
+        )
+        self._lru.set(key, data, ttl=ttl)
+
+    def purge_expired(self, before: Optional[float] = None) -> int:
+        """Delete rows that expired before `before` (default: now) and return how many were removed."""
+        before = time.time() if before is None else before
+        cursor = self._connect().execute("DELETE FROM nhtsa_cache WHERE expires_at <= ?", (before,))
+        return cursor.rowcount
+
+    def expiring(self, before: float) -> List[Tuple[str, Dict[str, Any], float]]:
+        """(key, data, expires_at) for entries expiring before `before`, soonest first; expired ones included."""
+        rows = self._connect().execute(
+            "SELECT cache_key, data, expires_at FROM nhtsa_cache WHERE expires_at < ? ORDER BY expires_at",
+            (before,),
+        ).fetchall()
+        return [(key, json.loads(data), expires_at) for key, data, expires_at in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._connect().execute("SELECT COUNT(*) FROM nhtsa_cache").fetchone()[0]
+        return {"entries": entries, "lru": self._lru.stats()}
+
+    def _migrate_json(self, legacy_json: Path) -> None:
+        """Import the old whole-file JSON cache, once per database."""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'migrated_json'").fetchone():
+            return
+        entries: Dict[str, Any] = {}
+        if legacy_json.exists():
+            try:
+                with legacy_json.open("r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                entries = {}
+
+        rows = []
+        for key, entry in entries.items():
+            try:
+                cached_at = datetime.fromisoformat(entry.get("cached_at", "2000-01-01")).timestamp()
+                rows.append((key, json.dumps(entry["data"]), cached_at, cached_at + self.ttl_seconds))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue  # Skip malformed entries
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we were reading the file
+            if not conn.execute("SELECT 1 FROM store_meta WHERE key = 'migrated_json'").fetchone():
+                # Keep anything already written to the store over the older JSON entries
+                conn.executemany(
+                    "INSERT OR IGNORE INTO nhtsa_cache (cache_key, data, cached_at, expires_at) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute(
+                    "INSERT INTO store_meta (key, value) VALUES ('migrated_json', ?)",
+                    (json.dumps({"source": str(legacy_json), "entries": len(rows)}),),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
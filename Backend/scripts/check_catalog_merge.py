@@ -0,0 +1,331 @@
+"""
+Check the catalog merge against a plain record-by-record merge, and time it.
+
+Merges generated sources full of awkward rows (differently spelled makes and models,
+string and float years, missing keys, nulls, zeros, nested values) with both and
+compares the JSON output, including key order and provenance. Checks that a Kaggle
+sync after an NHTSA enrichment run still takes effect. Then merges the Kaggle catalog
+scaled to `--rows` rows per source, as records and as binary snapshots, and publishes
+those sources the way the sync scripts do: the loader must map the merged catalog
+published with them and serve exactly what merging on load gives.
+"""
+
+import argparse
+import json
+import random
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.data import catalog
+from app.data.catalog import KAGGLE_CACHE_FILE, MOCK_CARS, SUPPLEMENT_SOURCES
+from app.data.merge import (
+    DEFAULT_RULE,
+    FIELD_RULES,
+    IDENTITY_FIELDS,
+    MODEL,
+    PROVENANCE_FIELD,
+    ZERO_IS_MISSING,
+    merge_catalogs,
+)
+from app.data.snapshot import SnapshotRecords, open_snapshot, write_snapshot
+from app.services.nhtsa_issues import vehicle_cache_key
+from enrich_nhtsa import nhtsa_source_records
+
+MAKES = ["Toyota", "toyota ", "TOYOTA", "Honda", "Rolls-Royce", "rolls royce", None, ""]
+MODELS = ["Camry", "CR-V", "crv", "Civic", "F-150", "Ka+"]
+YEARS = [2020, 2021, "2021", 2021.0, None]
+VALUES = [None, "", 0, 1, 2.5, "x", [1, 2], {"a": 1}, 0.0]
+FIELDS = {
+    "kaggle": ["price", "seats", "mpg", "horsepower", "safety_score", "drivetrain"],
+    "api": ["price", "mpg", "annual_cost", "reliability_score", "drivetrain", "fuel_type"],
+    "extra": ["mpg", "complaints_count", "price", "trim"],
+    "nhtsa": ["complaints_count", "recalls_count", "reliability_score", "safety_score"],
+}
+
+Source = Tuple[str, Sequence[Dict[str, Any]]]
+
+
+def _reference_key(record: Dict[str, Any]) -> Optional[Tuple[Any, ...]]:
+    make, model, year = record.get("make"), record.get("model"), record.get("year")
+    if not (make and model and year):
+        return None
+    normalize = lambda text: re.sub(r"[^0-9a-z]+", "", str(text).casefold())  # noqa: E731
+    try:
+        year = int(float(year))
+    except (TypeError, ValueError):
+        year = normalize(year)
+    return normalize(make), normalize(model), year
+
+
+def reference_merge(sources: List[Source], supplements: Sequence[str] = SUPPLEMENT_SOURCES) -> List[Dict[str, Any]]:
+    """The merge spelled out one record and one field at a time."""
+    names = [name for name, _ in sources]
+    slots: Dict[Tuple[Any, ...], int] = {}
+    pairs: List[Tuple[Optional[Tuple[Any, ...]], Dict[int, Dict[str, Any]]]] = []
+    blocks: Dict[Tuple[int, Tuple[Any, ...]], List[Dict[str, Any]]] = {}
+    for index, (_, records) in enumerate(sources):
+        ranks: Dict[Tuple[Any, ...], int] = {}
+        for record in records:
+            key = _reference_key(record)
+            if key is None:
+                pairs.append((None, {index: record}))
+                continue
+            rank = ranks[key] = ranks.get(key, -1) + 1
+            blocks.setdefault((index, key), []).append(record)
+            if (key, rank) not in slots:
+                slots[(key, rank)] = len(pairs)
+                pairs.append((key, {}))
+            pairs[slots[(key, rank)]][1][index] = record
+
+    fields = [
+        field
+        for field in dict.fromkeys(field for _, records in sources for record in records for field in record)
+        if field != PROVENANCE_FIELD
+    ]
+
+    def missing(field: str, value: Any) -> bool:
+        return value is None or value == "" or (field in ZERO_IS_MISSING and value == 0)
+
+    merged = []
+    for key, rows in pairs:
+        if all(names[index] in supplements for index in rows):
+            continue
+        record: Dict[str, Any] = {}
+        provenance: Dict[str, str] = {}
+        for field in fields:
+            rule = FIELD_RULES.get(field, DEFAULT_RULE)
+            order = list(range(len(sources)))
+            if field not in IDENTITY_FIELDS:
+                preferred = [names.index(name) for name in rule.precedence if name in names]
+                order = preferred + [index for index in order if index not in preferred]
+            candidates = [
+                (index, rows[index][field])
+                for index in order
+                if index in rows and field in rows[index]
+                and (field in IDENTITY_FIELDS or not missing(field, rows[index][field]))
+            ]
+            if not candidates and rule.scope == MODEL and field not in IDENTITY_FIELDS and key is not None:
+                candidates = [
+                    (index, row[field])
+                    for index in order
+                    for row in blocks.get((index, key), [])
+                    if field in row and not missing(field, row[field])
+                ]
+            if not candidates:
+                candidates = [(index, rows[index][field]) for index in order if index in rows and field in rows[index]]
+            if candidates:
+                index, record[field] = candidates[0]
+                provenance[field] = names[index]
+        record[PROVENANCE_FIELD] = provenance
+        merged.append(record)
+    return merged
+
+
+def _generated_sources(rng: random.Random) -> List[Source]:
+    sources = []
+    for name, fields in FIELDS.items():
+        records = []
+        for row in range(rng.randint(0, 60)):
+            record = {"id": f"{name}_{row}", "make": rng.choice(MAKES), "model": rng.choice(MODELS)}
+            if rng.random() < 0.95:
+                record["year"] = rng.choice(YEARS)
+            record.update({field: rng.choice(VALUES) for field in fields if rng.random() < 0.8})
+            records.append(record)
+        sources.append((name, records))
+    return sources[: rng.randint(1, len(sources))]
+
+
+def _check_sync_after_enrich() -> bool:
+    """
+    Enrich a merged catalog, then sync a Kaggle catalog that changes one vehicle and
+    drops another: the merge must serve the new Kaggle data with the NHTSA fields.
+    """
+    kaggle = [
+        {"id": "ford_focus_2025", "make": "Ford", "model": "Focus", "year": 2025, "fuel_type": "gas", "price": 25000},
+        {"id": "ford_puma_2025", "make": "Ford", "model": "Puma", "year": 2025, "fuel_type": "gas", "price": 21000},
+        {"id": "ford_focus_2025_2", "make": "Ford", "model": "Focus", "year": 2025, "fuel_type": "gas", "price": 31000},
+    ]
+    api = [{"id": "kia_ceed_2025", "make": "Kia", "model": "Ceed", "year": "2025", "mpg": 40.0, "fuel_type": "diesel"}]
+    catalog = merge_catalogs([("kaggle", kaggle), ("api", api)], supplements=SUPPLEMENT_SOURCES)
+
+    # What enrich_nhtsa does: one lookup per vehicle, written to the NHTSA source only
+    vehicles = {
+        vehicle_cache_key(car["year"], car["make"], car["model"]): (car["year"], car["make"], car["model"])
+        for car in catalog
+    }
+    lookup = {"complaints_count": 3, "recalls_count": 1, "reliability_score": 0.8, "safety_score": 0.7}
+    nhtsa = nhtsa_source_records([], vehicles, {key: lookup for key in vehicles})
+
+    synced = [{**kaggle[0], "fuel_type": "ev"}, kaggle[2]]
+    sources = [("kaggle", synced), ("api", api), ("nhtsa", nhtsa)]
+    merged = merge_catalogs(sources, supplements=SUPPLEMENT_SOURCES)
+    by_id = {car["id"]: car for car in merged}
+    focus = by_id.get("ford_focus_2025", {})
+    ok = (
+        sorted(by_id) == ["ford_focus_2025", "ford_focus_2025_2", "kia_ceed_2025"]
+        and focus.get("fuel_type") == "ev"
+        and focus[PROVENANCE_FIELD].get("fuel_type") == "kaggle"
+        and all(car.get("complaints_count") == 3 for car in merged)
+        and all(car[PROVENANCE_FIELD].get("complaints_count") == "nhtsa" for car in merged)
+        and json.dumps(merged) == json.dumps(reference_merge(sources))
+    )
+    print(f"[{'OK' if ok else 'FAIL'}] a Kaggle sync after enrichment changes and removes vehicles")
+    if not ok:
+        print(f"       {merged}")
+    return ok
+
+
+def _check_published_merge(sources: List[Source]) -> bool:
+    """
+    Publish the sources into a scratch cache directory. The loader must map the merged
+    catalog published with the last of them, fall back to merging on load once a source
+    is copied in by hand, and map again after publish_merged_catalog; all three must
+    serve the same records.
+    """
+    names = ("CACHE_SOURCES", "CACHE_FILES", "MERGED_CATALOG_FILE", "GENERATION_FILE", "_CURRENT")
+    saved = {name: getattr(catalog, name) for name in names}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Path(tmp)
+            catalog.CACHE_SOURCES = tuple((name, cache / path.name) for name, path in saved["CACHE_SOURCES"])
+            catalog.CACHE_FILES = tuple(path for _, path in catalog.CACHE_SOURCES)
+            catalog.MERGED_CATALOG_FILE = cache / saved["MERGED_CATALOG_FILE"].name
+            catalog.GENERATION_FILE = cache / catalog.GENERATION_FILE_NAME
+            catalog._CURRENT = None
+            paths = dict(catalog.CACHE_SOURCES)
+            for name, records in sources:
+                catalog.save_catalog(list(records), paths[name])
+
+            loads = {}
+            served = {}
+            start = time.perf_counter()
+            mapped = catalog.get_catalog()
+            loads["published merge"] = time.perf_counter() - start
+            served["published merge"] = json.dumps(list(mapped.cars))
+
+            # A copy gets a new mtime, which the published merge no longer matches
+            copy = cache / "copy.tmp"
+            shutil.copy(paths[sources[0][0]], copy)
+            os.replace(copy, paths[sources[0][0]])
+            start = time.perf_counter()
+            on_load = catalog.get_catalog()
+            loads["merge on load"] = time.perf_counter() - start
+            served["merge on load"] = json.dumps(list(on_load.cars))
+
+            catalog.publish_merged_catalog()
+            start = time.perf_counter()
+            republished = catalog.get_catalog()
+            loads["republished merge"] = time.perf_counter() - start
+            served["republished merge"] = json.dumps(list(republished.cars))
+
+            ok = (
+                isinstance(mapped.cars, SnapshotRecords)
+                and not isinstance(on_load.cars, SnapshotRecords)
+                and isinstance(republished.cars, SnapshotRecords)
+                and len(set(served.values())) == 1
+            )
+            del mapped, on_load, republished
+    finally:
+        for name, value in saved.items():
+            setattr(catalog, name, value)
+    timings = ", ".join(f"{label} {elapsed:.2f}s" for label, elapsed in loads.items())
+    print(f"[{'OK' if ok else 'FAIL'}] catalog loads from the published merge and on load agree: {timings}")
+    return ok
+
+
+def _scaled_sources(rows: int, rng: random.Random) -> List[Source]:
+    if KAGGLE_CACHE_FILE.exists():
+        with KAGGLE_CACHE_FILE.open("r", encoding="utf-8") as f:
+            base = json.load(f)
+    else:
+        base = MOCK_CARS
+    kaggle = [
+        {**base[row % len(base)], "id": f"kaggle_{row}", "year": 2025 - row // len(base)} for row in range(rows)
+    ]
+    api = [
+        {
+            "id": f"api_{row}",
+            "make": car["make"].upper(),
+            "model": car["model"],
+            "year": str(car["year"]),
+            "price": 0,
+            "drivetrain": rng.choice(["AWD", "FWD", "RWD"]),
+            "mpg": rng.choice([0, 28.0, 35.0]),
+            "annual_cost": 1500,
+            "reliability_score": round(rng.random(), 2),
+        }
+        for row, car in enumerate(kaggle)
+    ]
+    rng.shuffle(api)
+    return [("kaggle", kaggle), ("api", api)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the catalog merge with a record-by-record merge.")
+    parser.add_argument("--trials", type=int, default=200, help="Generated source sets to compare.")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows per source in the timing run.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for trial in range(args.trials):
+        sources = _generated_sources(rng)
+        expected, actual = reference_merge(sources), merge_catalogs(sources, supplements=SUPPLEMENT_SOURCES)
+        if json.dumps(expected) != json.dumps(actual):
+            print(f"[FAIL] generated sources, trial {trial}")
+            for a, b in zip(expected, actual):
+                if a != b:
+                    print(f"       first difference:\n       {a}\n       {b}")
+                    break
+            return 1
+    print(f"[OK] {args.trials} generated source sets merged like the record-by-record merge")
+    if not _check_sync_after_enrich():
+        return 1
+
+    sources = _scaled_sources(args.rows, rng)
+    start = time.perf_counter()
+    expected = reference_merge(sources)
+    by_record = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = merge_catalogs(sources)
+    merged = time.perf_counter() - start
+    same = json.dumps(expected) == json.dumps(actual)
+    print(
+        f"[{'OK' if same else 'FAIL'}] {len(sources)} x {args.rows} rows -> {len(actual)} records, "
+        f"record-by-record {by_record:.2f}s, merge {merged:.2f}s"
+    )
+    if not same:
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshots = []
+        for name, records in sources:
+            path = Path(tmp) / f"{name}.bin"
+            write_snapshot(records, path)
+            snapshots.append((name, SnapshotRecords(open_snapshot(path))))
+        start = time.perf_counter()
+        from_snapshots = merge_catalogs(snapshots)
+        merged = time.perf_counter() - start
+        same = json.dumps(from_snapshots) == json.dumps(actual)
+        print(f"[{'OK' if same else 'FAIL'}] same merge from binary snapshots: {merged:.2f}s")
+        del snapshots, from_snapshots
+    if not same:
+        return 1
+    if not _check_published_merge(sources):
+        return 1
+
+    print("[SUCCESS] The catalog merge matches the record-by-record merge")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
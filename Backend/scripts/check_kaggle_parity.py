@@ -0,0 +1,201 @@
+"""
+Check that the column-wise Kaggle ingestion builds exactly the records the row-by-row
+build does, and time both.
+
+Runs over the Kaggle CSV, a generated frame of awkward cells (ranges, "k" suffixes,
+NaN, blank names, colliding ids, a missing column), and the CSV repeated `--scale`
+times for timing. Also checks that reading a CSV whole and in chunks gives the same
+records, including numeric columns with blank cells that pandas would otherwise read
+as floats.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.data.kaggle_catalog import (
+    DATASET_SLUG,
+    RAW_DIR,
+    YEAR_FALLBACK,
+    _normalize_text,
+    _slugify,
+    _title_case,
+    iter_kaggle_chunks,
+    kaggle_records,
+    normalize_fuel_type,
+    parse_float,
+    parse_int,
+    parse_price,
+    read_kaggle_csv,
+)
+
+CELLS = [
+    "", " ", "nan", "NaN", None, float("nan"), "N/A", "12", " 7 ", "2,5", "1,100,000", "$12,000-$15,000",
+    "45k", "45K-60k", "1,500k", "$999.5k", "0.5", "3.14159 sec", "100 - 140 Nm", "5+2", "2 / 4 / 7",
+    "1.2L Petrol", "Electric", "plug in hyrbrid", "Hybrid (Petrol)", "Diesel/Petrol", "CNG gas",
+    "Premium gas", "EV", "never", "1..2", "9" * 20, "12.5.7", "Ærø 4", 3, 2.5, 1e21,
+]
+NAMES = ["Ford", "FORD", "ford ", "Rolls Royce", "rolls-royce", "KA+", "Ka", "", "nan", "Mercedes-Benz", "Ñandú"]
+
+
+def kaggle_records_by_row(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """The original row-by-row build, as the reference for `kaggle_records`."""
+    cars: List[Dict[str, Any]] = []
+    seen_ids = set()
+
+    for _, row in df.iterrows():
+        make = _title_case(row.get("Company Names"))
+        model = _title_case(row.get("Cars Names"))
+        if not make or not model:
+            continue
+
+        year = YEAR_FALLBACK
+        price = parse_price(row.get("Cars Prices"))
+        fuel_type = normalize_fuel_type(row.get("Fuel Types"))
+        seats = parse_int(row.get("Seats"))
+        zero_to_sixty = parse_float(row.get("Performance(0 - 100 )KM/H"))
+
+        car_id = _slugify([make, model, str(year)])
+        if car_id in seen_ids:
+            car_id = f"{car_id}_{len(seen_ids)}"
+        seen_ids.add(car_id)
+
+        cars.append(
+            {
+                "id": car_id,
+                "make": make,
+                "model": model,
+                "year": year,
+                "price": price,
+                "drivetrain": None,
+                "seats": seats,
+                "fuel_type": fuel_type,
+                "mpg": None,
+                "l_per_100km": None,
+                "zero_to_sixty": zero_to_sixty,
+                "annual_cost": None,
+                "reliability_score": None,
+                "safety_score": None,
+                "horsepower": parse_float(row.get("HorsePower")),
+                "engine": _normalize_text(row.get("Engines")),
+                "engine_cc_or_battery": _normalize_text(row.get("CC/Battery Capacity")),
+                "top_speed_kmh": parse_float(row.get("Total Speed")),
+                "torque": _normalize_text(row.get("Torque")),
+                "source": "kaggle",
+                "source_dataset": DATASET_SLUG,
+                "price_raw": _normalize_text(row.get("Cars Prices")),
+            }
+        )
+
+    return cars
+
+
+def _generated_frame(rng: random.Random, rows: int) -> pd.DataFrame:
+    columns = [
+        "Company Names", "Cars Names", "Engines", "CC/Battery Capacity", "HorsePower", "Total Speed",
+        "Performance(0 - 100 )KM/H", "Cars Prices", "Fuel Types", "Seats", "Torque",
+    ]
+    data = {
+        name: [rng.choice(NAMES if name.endswith("Names") else CELLS) for _ in range(rows)] for name in columns
+    }
+    # Names that slug to an id another row gets only after deduplication
+    data["Company Names"][:4] = ["Ford", "Ford", "Ford", "Ford"]
+    data["Cars Names"][:4] = ["Ka", "Ka", "Ka 2025 1", "Ka"]
+    return pd.DataFrame(data)
+
+
+def _compare(label: str, df: pd.DataFrame) -> bool:
+    start = time.perf_counter()
+    expected = kaggle_records_by_row(df)
+    by_row = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = kaggle_records(df)
+    by_column = time.perf_counter() - start
+    same = json.dumps(expected) == json.dumps(actual)
+    print(
+        f"[{'OK' if same else 'FAIL'}] {label}: {len(df)} rows -> {len(actual)} records, "
+        f"row-by-row {by_row:.3f}s, column-wise {by_column:.3f}s ({by_row / max(by_column, 1e-9):.1f}x)"
+    )
+    if not same:
+        for index, (a, b) in enumerate(zip(expected, actual)):
+            if a != b:
+                print(f"       first difference at record {index}:\n       {a}\n       {b}")
+                break
+    return same
+
+
+def _numeric_csv(path: Path, rows: int) -> None:
+    """A CSV whose CC/Battery Capacity, Torque and Seats columns are numbers with blanks."""
+    frame = pd.DataFrame(
+        {
+            "Company Names": ["Ford", "Kia", "Ford"] * rows,
+            "Cars Names": ["Focus", "Ceed", "Puma"] * rows,
+            "Engines": ["I4", "", "I3"] * rows,
+            "CC/Battery Capacity": ["1500", "", "999"] * rows,
+            "HorsePower": ["150", "120", ""] * rows,
+            "Total Speed": ["", "190", "200"] * rows,
+            "Performance(0 - 100 )KM/H": ["8.5", "", "9"] * rows,
+            "Cars Prices": ["25000", "", "21000"] * rows,
+            "Fuel Types": ["Petrol", "Diesel", ""] * rows,
+            "Seats": ["5", "", "5"] * rows,
+            "Torque": ["250", "", "170"] * rows,
+        }
+    )
+    frame.to_csv(path, index=False)
+
+
+def _compare_chunked(label: str, csv_path: Path, chunk_size: int) -> bool:
+    whole = read_kaggle_csv(csv_path)
+    seen_ids: set = set()
+    chunked = [car for chunk in iter_kaggle_chunks(csv_path, chunk_size) for car in kaggle_records(chunk, seen_ids)]
+    same = json.dumps(kaggle_records(whole)) == json.dumps(chunked)
+    print(f"[{'OK' if same else 'FAIL'}] {label}: whole and in chunks of {chunk_size} give the same records")
+    return same
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare column-wise and row-by-row Kaggle ingestion.")
+    parser.add_argument("--scale", type=int, default=20, help="Copies of the CSV in the timing run.")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows in the generated frame.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    csv_files = sorted(RAW_DIR.glob("*.csv"))
+    rng = random.Random(args.seed)
+    generated = _generated_frame(rng, args.rows)
+
+    ok = True
+    for csv_path in csv_files:
+        ok &= _compare(csv_path.name, read_kaggle_csv(csv_path))
+    ok &= _compare("generated", generated)
+    ok &= _compare("generated, no Seats column", generated.drop(columns=["Seats"]))
+    ok &= _compare("generated, first row only", generated.head(1))
+    ok &= _compare("generated, no rows", generated.head(0))
+    with tempfile.TemporaryDirectory() as tmp:
+        numeric_csv = Path(tmp) / "numeric.csv"
+        _numeric_csv(numeric_csv, 50)
+        ok &= _compare("numeric columns with blanks", read_kaggle_csv(numeric_csv))
+        ok &= _compare_chunked("numeric columns with blanks", numeric_csv, 7)
+    for csv_path in csv_files:
+        ok &= _compare_chunked(csv_path.name, csv_path, 100)
+    if csv_files:
+        df = read_kaggle_csv(csv_files[0])
+        ok &= _compare(f"{csv_files[0].name} x{args.scale}", pd.concat([df] * args.scale, ignore_index=True))
+
+    if not ok:
+        return 1
+    print("[SUCCESS] Column-wise ingestion matches the row-by-row build")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
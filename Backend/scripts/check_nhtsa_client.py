@@ -0,0 +1,318 @@
+"""
+Exercise the sync and async NHTSA clients against a local stub server.
+
+The stub serves the complaints and recalls endpoints with a fixed delay and counts
+the TCP connections it accepts. The script checks that both clients return the same
+results, that the async client fetches both endpoints concurrently and reuses pooled
+connections, that concurrent lookups of one vehicle share a single fetch, that
+intermittent 503s are retried, and that server errors come back as "NHTSA service
+unavailable". It then checks that expired entries are served stale while they
+refresh, and that an API that keeps failing trips the circuit breaker.
+
+Those checks give the stub host the retries of a batch script. A last one gives it
+the server's settings for api.nhtsa.gov and checks that a throttled or hanging API
+costs a single attempt.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import http_cache, http_client, nhtsa_issues
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.nhtsa_store import NHTSAStore
+
+VEHICLES = [(2015 + i % 8, make, model) for i, (make, model) in enumerate(
+    [("Toyota", "Camry"), ("Honda", "Civic"), ("Ford", "F-150"), ("Tesla", "Model 3"),
+     ("Subaru", "Outback"), ("Kia", "Soul"), ("Flaky", "Sometimes"), ("Fail", "Always")]
+)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    connections = 0
+    requests = 0
+    flaky_requests = {}
+    lock = threading.Lock()
+
+    def setup(self) -> None:
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_GET(self) -> None:
+        with StubHandler.lock:
+            StubHandler.requests += 1
+        time.sleep(self.delay)
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if query.get("make") == "Fail":
+            self._send(404, {"message": "stub failure"})
+            return
+        if query.get("make") == "Down":
+            self._send(500, {"message": "stub outage"})
+            return
+        if query.get("make") == "Flaky":
+            # Every other request to each endpoint is throttled
+            with StubHandler.lock:
+                count = StubHandler.flaky_requests[url.path] = StubHandler.flaky_requests.get(url.path, 0) + 1
+                throttled = count % 2 == 1
+            if throttled:
+                self._send(503, {"message": "try again"}, {"Retry-After": "0"})
+                return
+        # Deterministic counts derived from the vehicle and the endpoint
+        seed = sum(map(ord, f"{url.path}{query.get('make')}{query.get('model')}{query.get('modelYear')}"))
+        self._send(200, {"results": [{}] * (seed % 40)})
+
+    def _send(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # Room for every concurrent connect; the default backlog of 5 drops SYNs
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients drop connections they no longer need (e.g. after a failed sibling call)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+async def _fetch_all_async(rounds: int):
+    """Fetch every vehicle `rounds` times over one client; later rounds reuse its pool."""
+    try:
+        for _ in range(rounds):
+            results = await asyncio.gather(
+                *(nhtsa_issues.get_complaints_and_recalls_async(*vehicle, use_cache=False) for vehicle in VEHICLES)
+            )
+        return results
+    finally:
+        await http_client.close_async_clients()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the NHTSA clients against a local stub.")
+    parser.add_argument("--delay", type=float, default=0.2, help="Stub response delay in seconds.")
+    parser.add_argument("--callers", type=int, default=25, help="Concurrent callers for the coalescing check.")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    # Every request must reach the stub; don't record its responses either
+    http_cache.MODE = http_cache.MODE_OFF
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    nhtsa_issues.BASE = f"http://127.0.0.1:{server.server_address[1]}"
+    # The stub is not api.nhtsa.gov; retry it like the sync and enrich scripts do
+    http_client.configure_host(nhtsa_issues.BASE, max_retries=http_client.DEFAULT_HOST.max_retries)
+
+    failures = []
+    try:
+        start = time.perf_counter()
+        sync_results = [nhtsa_issues.get_complaints_and_recalls(*vehicle, use_cache=False) for vehicle in VEHICLES]
+        sync_elapsed = time.perf_counter() - start
+        sync_connections = StubHandler.connections
+
+        StubHandler.connections = 0
+        start = time.perf_counter()
+        async_results = asyncio.run(_fetch_all_async(rounds=2))
+        async_elapsed = time.perf_counter() - start
+        async_connections = StubHandler.connections
+
+        StubHandler.connections = 0
+        start = time.perf_counter()
+        single = asyncio.run(_fetch_one_async())
+        single_elapsed = time.perf_counter() - start
+
+        # Concurrent callers for one vehicle: each endpoint should be hit once per client
+        StubHandler.requests = 0
+        asyncio.run(_fetch_one_async(callers=args.callers))
+        async_coalesced_requests = StubHandler.requests
+        StubHandler.requests = 0
+        with ThreadPoolExecutor(max_workers=args.callers) as pool:
+            list(pool.map(lambda _: nhtsa_issues.get_complaints_and_recalls(*VEHICLES[0], use_cache=False), range(args.callers)))
+        thread_coalesced_requests = StubHandler.requests
+
+        # Keep the lookups below out of the real store
+        with tempfile.TemporaryDirectory() as tmp:
+            nhtsa_issues._store = NHTSAStore(Path(tmp) / "nhtsa.sqlite3", ttl_seconds=3600)
+            stale_checks = _check_stale()
+            breaker_checks = _check_breaker()
+        request_path_checks = _check_request_path()
+    finally:
+        server.shutdown()
+
+    requests_made = 2 * len(VEHICLES)
+    print(f"[INFO] sync:  {sync_elapsed:.2f}s, {sync_connections} connections for {requests_made} requests")
+    print(f"[INFO] async: {async_elapsed:.2f}s, {async_connections} connections for {2 * requests_made} requests")
+    print(f"[INFO] async single vehicle: {single_elapsed:.2f}s with a {args.delay:.2f}s stub delay")
+    print(
+        f"[INFO] {args.callers} concurrent callers for one vehicle: "
+        f"{async_coalesced_requests} async / {thread_coalesced_requests} threaded upstream requests"
+    )
+    print(f"[INFO] single-flight: {nhtsa_issues._flights.stats()}")
+    host_stats = http_client.stats()[urlparse(nhtsa_issues.BASE).netloc]
+    print(f"[INFO] stub host: {host_stats['requests']} requests, {host_stats['retries']} retries, errors {host_stats['errors']}")
+
+    if json.dumps(sync_results) != json.dumps(list(async_results)):
+        failures.append("sync and async results differ")
+    if "error" not in async_results[-1]:
+        failures.append("stub failure was not reported as unavailable")
+    if "error" in async_results[-2] or "error" in sync_results[-2]:
+        failures.append("throttled requests were not retried")
+    if single_elapsed >= 2 * args.delay:
+        failures.append("complaints and recalls were not fetched concurrently")
+    if async_coalesced_requests != 2 or thread_coalesced_requests != 2:
+        failures.append("concurrent lookups of one vehicle were not coalesced")
+    # The per-host cap bounds each pool, and later requests reuse its connections
+    max_connections = http_client.host_config(nhtsa_issues.BASE).max_concurrency
+    if sync_connections > max_connections or async_connections > max_connections:
+        failures.append("clients did not reuse their pooled connections")
+
+    failures.extend(stale_checks)
+    failures.extend(breaker_checks)
+    failures.extend(request_path_checks)
+
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if failures:
+        return 1
+    print(f"[SUCCESS] {len(VEHICLES)} vehicles fetched identically by both clients")
+    return 0
+
+
+def _check_stale() -> list:
+    """An expired entry comes back without waiting for the API and is then refreshed."""
+    key = nhtsa_issues.vehicle_cache_key(*VEHICLES[0])
+    stale = {**nhtsa_issues._unavailable(*VEHICLES[0]), "stale": True}
+    nhtsa_issues._store.set(key, stale, ttl=-1)
+
+    start = time.perf_counter()
+    served = nhtsa_issues.get_complaints_and_recalls(*VEHICLES[0])
+    stale_elapsed = time.perf_counter() - start
+    deadline = time.monotonic() + 5
+    while nhtsa_issues.nhtsa_stats()["refresh"]["in_progress"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    refreshed = nhtsa_issues._store.get(key)
+    print(f"[INFO] stale entry served in {stale_elapsed * 1000:.1f}ms, refresh: {nhtsa_issues.nhtsa_stats()['refresh']}")
+
+    failures = []
+    if served != stale:
+        failures.append("expired entry was not served stale")
+    if refreshed is None or "stale" in refreshed or "error" in refreshed:
+        failures.append("expired entry was not refreshed in the background")
+    return failures
+
+
+def _check_breaker() -> list:
+    """Repeated 500s open the breaker; then lookups fail without calling the API."""
+    nhtsa_issues._breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    down = [(2020, "Down", f"Model {i}") for i in range(6)]
+    StubHandler.requests = 0
+    results = [nhtsa_issues.get_complaints_and_recalls(*vehicle, use_cache=False) for vehicle in down]
+    requests_while_failing = StubHandler.requests
+
+    StubHandler.requests = 0
+    start = time.perf_counter()
+    negative = nhtsa_issues.get_complaints_and_recalls(*down[0])
+    open_elapsed = time.perf_counter() - start
+    breaker = nhtsa_issues._breaker.stats()
+    print(
+        f"[INFO] breaker after {len(down)} failing lookups: {breaker}, "
+        f"{requests_while_failing} upstream requests, cached failure in {open_elapsed * 1000:.1f}ms"
+    )
+
+    failures = []
+    if not all("error" in result for result in results):
+        failures.append("server errors were not reported as unavailable")
+    if breaker["state"] != "open":
+        failures.append("circuit breaker did not open")
+    # Three lookups reach the API (one attempt each, plus any retries); the rest fail fast
+    max_retries = http_client.host_config(nhtsa_issues.BASE).max_retries
+    if requests_while_failing > 3 * (1 + max_retries):
+        failures.append("lookups kept calling the API after the breaker opened")
+    if "error" not in negative or StubHandler.requests:
+        failures.append("recent failure was not answered from the negative cache")
+    return failures
+
+
+def _check_request_path() -> list:
+    """With the server's settings, a throttled or silent API gets one attempt and no backoff."""
+    timeout = 1.0
+    http_client.configure_host(nhtsa_issues.BASE, **{**asdict(http_client.HOSTS["api.nhtsa.gov"]), "timeout": timeout})
+    failures = []
+
+    StubHandler.requests = 0
+    StubHandler.flaky_requests = {}
+    resp = http_client.get(f"{nhtsa_issues.BASE}/complaints/complaintsByVehicle", params={"make": "Flaky"})
+    if resp.status_code != 503 or StubHandler.requests != 1:
+        failures.append("a throttled request was retried on the request path")
+
+    # Accepts connections and never answers
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(16)
+    url = f"http://127.0.0.1:{silent.getsockname()[1]}/complaints/complaintsByVehicle"
+    try:
+        elapsed = {}
+        start = time.perf_counter()
+        try:
+            http_client.get(url)
+        except http_client.requests.Timeout:
+            pass
+        elapsed["sync"] = time.perf_counter() - start
+
+        async def fetch() -> None:
+            try:
+                await http_client.get_async(url)
+            except http_client.httpx.TimeoutException:
+                pass
+            finally:
+                await http_client.close_async_clients()
+
+        start = time.perf_counter()
+        asyncio.run(fetch())
+        elapsed["async"] = time.perf_counter() - start
+    finally:
+        silent.close()
+    print(f"[INFO] silent API with a {timeout:.1f}s timeout: " + ", ".join(f"{k} {v:.2f}s" for k, v in elapsed.items()))
+    if max(elapsed.values()) > 1.5 * timeout:
+        failures.append("a hanging request was retried on the request path")
+    return failures
+
+
+async def _fetch_one_async(callers: int = 1):
+    try:
+        results = await asyncio.gather(
+            *(nhtsa_issues.get_complaints_and_recalls_async(*VEHICLES[0], use_cache=False) for _ in range(callers))
+        )
+        return results[0]
+    finally:
+        await http_client.close_async_clients()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
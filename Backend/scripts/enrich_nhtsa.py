@@ -2,88 +2,278 @@
 Script to enrich vehicle catalog with NHTSA safety and reliability data.
 
 Fetches complaints, recalls, and calculates safety/reliability scores for all vehicles in the catalog.
+Identical (year, make, model) triples are looked up once, by a small worker pool that
+shares a token-bucket rate limit. Partial results are checkpointed, so an interrupted
+run picks up where it stopped.
+
+Results go to their own catalog source, one record per year/make/model holding only the
+NHTSA fields, which the catalog merge joins onto every matching vehicle. The Kaggle and
+public API catalogs are never rewritten, so later syncs of those still take effect.
 """
-import sys
+import argparse
 import json
+import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from app.data.catalog import load_cars, CACHE_FILE, DATA_DIR
-from app.services.nhtsa_issues import get_complaints_and_recalls
+from app.data.catalog import load_cars, save_catalog, DATA_DIR, NHTSA_SOURCE_FILE
+from app.services import http_client
+from app.services.nhtsa_issues import (
+    BASE,
+    CACHE_DURATION_DAYS,
+    get_cached_complaints_and_recalls,
+    get_complaints_and_recalls,
+    vehicle_cache_key,
+)
+from app.services.rate_limit import TokenBucket
+
+CHECKPOINT_FILE = DATA_DIR / "cache" / "enrich_nhtsa.checkpoint.json"
+
+# Each lookup of an uncached vehicle makes two API calls (complaints + recalls)
+CALLS_PER_LOOKUP = 2
+
+Vehicle = Tuple[int, str, str]
+
+
+def _load_checkpoint(path: Path) -> Tuple[Optional[str], Dict[str, Dict[str, Any]]]:
+    """
+    Start time and results of an interrupted run, unless it started longer ago than the
+    NHTSA cache TTL.
+    """
+    if not path.exists():
+        return None, {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        started_at = datetime.fromisoformat(checkpoint["started_at"])
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None, {}
+    if datetime.now() - started_at >= timedelta(days=CACHE_DURATION_DAYS):
+        return None, {}
+    return checkpoint["started_at"], checkpoint.get("results", {})
+
+
+def _save_checkpoint(path: Path, started_at: str, results: Dict[str, Dict[str, Any]]) -> None:
+    """Write the checkpoint to a temp file and rename it, so a crash never leaves half a file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump({"started_at": started_at, "results": results}, f)
+    os.replace(tmp_path, path)
+
+
+def _lookup(vehicle: Vehicle, bucket: TokenBucket) -> Tuple[Dict[str, Any], bool]:
+    """Return the NHTSA data for a vehicle and whether it came from the cache."""
+    year, make, model = vehicle
+    cached = get_cached_complaints_and_recalls(year, make, model)
+    if cached is not None:
+        return cached, True
+    bucket.acquire(CALLS_PER_LOOKUP)
+    return get_complaints_and_recalls(year, make, model, use_cache=True, allow_stale=False), False
+
+
+def _load_nhtsa_source(path: Path) -> List[Dict[str, Any]]:
+    """Records of the NHTSA source written by the previous run, if any."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            records = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return []
+    return [record for record in records if isinstance(record, dict)] if isinstance(records, list) else []
+
+
+def nhtsa_source_records(
+    previous: Sequence[Dict[str, Any]],
+    vehicles: Dict[str, Vehicle],
+    results: Dict[str, Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    NHTSA source records: `previous` ones updated with the `results` of this run, by
+    vehicle cache key. Vehicles not looked up this time keep their previous record.
+    """
+    records: Dict[str, Dict[str, Any]] = {}
+    for record in previous:
+        try:
+            records[vehicle_cache_key(record["year"], record["make"], record["model"])] = record
+        except (KeyError, TypeError, AttributeError):
+            continue
+    for key, nhtsa_data in results.items():
+        year, make, model = vehicles[key]
+        records[key] = {
+            "make": make,
+            "model": model,
+            "year": year,
+            "complaints_count": nhtsa_data.get("complaints_count", 0),
+            "recalls_count": nhtsa_data.get("recalls_count", 0),
+            "reliability_score": nhtsa_data.get("reliability_score", 0.5),
+            "safety_score": nhtsa_data.get("safety_score", 0.5),
+        }
+    return list(records.values())
 
 
-def enrich_catalog_with_nhtsa():
+def enrich_catalog_with_nhtsa(
+    workers: int = 4,
+    rate: float = 4.0,
+    checkpoint_every: int = 25,
+    skip_enriched: bool = False,
+):
     """
-    Load existing catalog and enrich each vehicle with NHTSA data.
-    Updates the cached catalog file with new safety/reliability information.
+    Load existing catalog and look up NHTSA data for each vehicle.
+    Updates the NHTSA catalog source with new safety/reliability information.
+
+    Args:
+        workers: Concurrent lookups
+        rate: NHTSA API calls per second, shared by all workers
+        checkpoint_every: Completed lookups between checkpoint writes
+        skip_enriched: Leave vehicles that already have complaint counts untouched
     """
     print("🚗 Loading vehicle catalog...")
     vehicles = load_cars()
     print(f"   Found {len(vehicles)} vehicles")
-    
-    enriched = []
-    failed = []
-    
+
+    # Deduplicate to one lookup per (year, make, model)
+    unique: Dict[str, Vehicle] = {}
+    keys = []
+    skipped = 0
     for idx, car in enumerate(vehicles, 1):
         make = car.get("make")
         model = car.get("model")
         year = car.get("year")
-        
+
         if not (make and model and year):
             print(f"⚠️  Skipping vehicle {idx}/{len(vehicles)}: Missing make/model/year")
-            enriched.append(car)
+            keys.append(None)
             continue
-        
-        print(f"📡 [{idx}/{len(vehicles)}] Fetching NHTSA data for {year} {make} {model}...", end=" ")
-        
-        try:
-            nhtsa_data = get_complaints_and_recalls(year, make, model, use_cache=True)
-            
+        if skip_enriched and car.get("complaints_count") is not None:
+            skipped += 1
+            keys.append(None)
+            continue
+        key = vehicle_cache_key(year, make, model)
+        unique.setdefault(key, (year, make, model))
+        keys.append(key)
+
+    started_at, checkpointed = _load_checkpoint(CHECKPOINT_FILE)
+    started_at = started_at or datetime.now().isoformat()
+    results = {key: data for key, data in checkpointed.items() if key in unique}
+    if results:
+        print(f"↩️  Resuming from checkpoint: {len(results)} lookups already done")
+    todo = [key for key in unique if key not in results]
+    print(
+        f"   {len(unique)} unique vehicles ({sum(k is not None for k in keys) - len(unique)} duplicates, "
+        f"{skipped} already enriched), {len(todo)} to look up"
+    )
+
+    bucket = TokenBucket(rate, capacity=max(rate, CALLS_PER_LOOKUP))
+    failed_keys = set()
+    api_lookups = 0
+    since_checkpoint = 0
+    start = time.perf_counter()
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(_lookup, unique[key], bucket): key for key in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            year, make, model = unique[key]
+            elapsed = time.perf_counter() - start
+            prefix = f"📡 [{done}/{len(todo)}] {year} {make} {model}"
+            try:
+                nhtsa_data, from_cache = future.result()
+            except Exception as e:
+                print(f"{prefix} ❌ ERROR: {e}")
+                failed_keys.add(key)
+                continue
+
+            api_lookups += not from_cache
             if "error" in nhtsa_data:
-                print(f"❌ FAILED")
-                failed.append(f"{year} {make} {model}")
-                enriched.append(car)
-            else:
-                # Merge NHTSA data into car record
-                car_enriched = {
-                    **car,
-                    "complaints_count": nhtsa_data.get("complaints_count", 0),
-                    "recalls_count": nhtsa_data.get("recalls_count", 0),
-                    "reliability_score": nhtsa_data.get("reliability_score", 0.5),
-                    "safety_score": nhtsa_data.get("safety_score", 0.5),
-                }
-                enriched.append(car_enriched)
-                print(f"✅ (Complaints: {nhtsa_data['complaints_count']}, Recalls: {nhtsa_data['recalls_count']})")
-            
-            # Rate limiting: sleep between requests to avoid hitting API limits
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"❌ ERROR: {e}")
-            failed.append(f"{year} {make} {model}")
-            enriched.append(car)
-    
-    # Save enriched catalog
-    print("\n💾 Saving enriched catalog...")
-    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with CACHE_FILE.open("w", encoding="utf-8") as f:
-        json.dump(enriched, f, indent=2)
-    
+                print(f"{prefix} ❌ FAILED")
+                failed_keys.add(key)
+                continue
+
+            results[key] = nhtsa_data
+            print(
+                f"{prefix} ✅ (Complaints: {nhtsa_data['complaints_count']}, "
+                f"Recalls: {nhtsa_data['recalls_count']}{', cached' if from_cache else ''}) "
+                f"- {done / max(elapsed, 1e-9):.1f} vehicles/s"
+            )
+
+            since_checkpoint += 1
+            if since_checkpoint >= checkpoint_every:
+                _save_checkpoint(CHECKPOINT_FILE, started_at, results)
+                since_checkpoint = 0
+    except BaseException:
+        # Drop queued lookups instead of waiting for them, and keep what is done
+        pool.shutdown(wait=False, cancel_futures=True)
+        _save_checkpoint(CHECKPOINT_FILE, started_at, results)
+        print(f"\n⏸️  Stopped; {len(results)} lookups saved to {CHECKPOINT_FILE}. Re-run to resume.")
+        raise
+    pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    enriched = sum(key in results for key in keys)
+    failed = [
+        f"{car.get('year')} {car.get('make')} {car.get('model')}"
+        for car, key in zip(vehicles, keys)
+        if key is not None and key not in results
+    ]
+
+    # Save the NHTSA source; the catalog merge joins it onto the vehicles
+    print("\n💾 Saving NHTSA results...")
+    records = nhtsa_source_records(_load_nhtsa_source(NHTSA_SOURCE_FILE), unique, results)
+    generation = save_catalog(records, NHTSA_SOURCE_FILE)
+    if CHECKPOINT_FILE.exists():
+        CHECKPOINT_FILE.unlink()
+
     print(f"\n✅ Enrichment complete!")
-    print(f"   Total vehicles: {len(enriched)}")
-    print(f"   Successfully enriched: {len(enriched) - len(failed)}")
+    print(f"   Total vehicles: {len(vehicles)}")
+    print(f"   Catalog generation: {generation}")
+    print(f"   Successfully enriched: {enriched}")
     print(f"   Failed: {len(failed)}")
-    
+    print(
+        f"   Lookups: {len(todo)} in {elapsed:.1f}s ({len(todo) / max(elapsed, 1e-9):.1f}/s), "
+        f"{api_lookups} from the API, {len(failed_keys)} failed"
+    )
+
     if failed:
         print(f"\n⚠️  Failed vehicles:")
         for vehicle in failed:
             print(f"   - {vehicle}")
-    
-    print(f"\n📁 Catalog saved to: {CACHE_FILE}")
+
+    print(f"\n📁 NHTSA results ({len(records)} vehicles) saved to: {NHTSA_SOURCE_FILE}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Enrich the vehicle catalog with NHTSA data.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent lookups.")
+    parser.add_argument("--rate", type=float, default=4.0, help="NHTSA API calls per second.")
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=25,
+        help="Completed lookups between checkpoint writes.",
+    )
+    parser.add_argument(
+        "--skip-enriched",
+        action="store_true",
+        help="Leave vehicles that already have complaint counts untouched.",
+    )
+    args = parser.parse_args()
+    # A batch run can wait out NHTSA errors that the server does not retry
+    http_client.configure_host(BASE, max_retries=http_client.DEFAULT_HOST.max_retries)
+    enrich_catalog_with_nhtsa(
+        workers=args.workers,
+        rate=args.rate,
+        checkpoint_every=args.checkpoint_every,
+        skip_enriched=args.skip_enriched,
+    )
 
 
 if __name__ == "__main__":
-    enrich_catalog_with_nhtsa()
+    main()
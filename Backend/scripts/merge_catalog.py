@@ -0,0 +1,28 @@
+"""
+Merge the cached catalog sources (Kaggle, public API, NHTSA) and publish the result.
+
+The sync and enrichment scripts already publish the merged catalog with every source
+they write. Run this after putting a source file in place by other means, e.g. copying
+it in by hand, so the server memory-maps a merge again instead of merging on load.
+"""
+
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.data.catalog import MERGED_CATALOG_FILE, publish_merged_catalog
+
+
+def main() -> int:
+    generation = publish_merged_catalog()
+    if generation is None:
+        print("[INFO] Fewer than two catalog sources have vehicles; nothing to merge.")
+        return 0
+    print(f"[SUCCESS] Wrote {MERGED_CATALOG_FILE} (catalog generation {generation})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
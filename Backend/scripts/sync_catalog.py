@@ -4,17 +4,21 @@ seed CSV for price/0-60/fuel_type fallbacks. Keeps scope small to avoid hammerin
 free APIs; expand MAKES/YEARS as needed.
 """
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
 import csv
-import json
 import sys
+import time
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT))
 
+from app.data.catalog import save_catalog
+from app.services import carquery, epa, http_cache, http_client, nhtsa_issues
 from app.services.carquery import get_trims
 from app.services.epa import get_vehicle_options, get_vehicle_mpg
+from app.services.http_client import host_config
 from app.services.nhtsa_issues import get_complaints_and_recalls
 
 CACHE_FILE = ROOT / "app" / "data" / "cache" / "vehicles.json"
@@ -26,6 +30,13 @@ SEED_FILE = ROOT / "app" / "data" / "seed_specs.csv"
 MAKES = ["Honda", "Subaru", "Toyota", "Nissan", "Ford"]
 YEARS = [2018, 2019, 2020, 2021, 2022]
 
+# Workers per API host, matching the shared client's per-host concurrency caps
+HOST_CONCURRENCY = {
+    "carquery": host_config(carquery.BASE_URL).max_concurrency,
+    "epa": host_config(epa.BASE_URL).max_concurrency,
+    "nhtsa": host_config(nhtsa_issues.BASE).max_concurrency,
+}
+
 
 def mpg_to_l_per_100km(mpg: Optional[float]) -> Optional[float]:
     if mpg is None or mpg <= 0:
@@ -105,13 +116,120 @@ def parse_int(value: Any) -> Optional[int]:
         return None
 
 
+class Stage:
+    """
+    One step of the sync pipeline running on its host's worker pool.
+
+    Calls are memoized by key, so a trim list that repeats a model (or models that
+    share an EPA vehicle id) costs a single request.
+    """
+
+    def __init__(self, name: str, pool: ThreadPoolExecutor) -> None:
+        self.name = name
+        self.pool = pool
+        self.results: Dict[Hashable, Any] = {}
+        self.requested = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Optional[Future]:
+        """Schedule fn(*args) unless `key` was already submitted; returns None for repeats."""
+        self.requested += 1
+        if key in self.results:
+            return None
+        self.results[key] = None
+        if self.started is None:
+            self.started = time.perf_counter()
+        return self.pool.submit(fn, *args)
+
+    def record(self, key: Hashable, result: Any) -> None:
+        self.results[key] = result
+        self.finished = time.perf_counter()
+
+    def report(self) -> str:
+        calls = len(self.results)
+        elapsed = (self.finished or 0.0) - (self.started or 0.0)
+        rate = calls / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{self.name:<12} {calls:>5} calls ({self.requested - calls} deduplicated) "
+            f"in {elapsed:6.1f}s = {rate:6.1f}/s"
+        )
+
+
+def _fresh_nhtsa(year: int, make: str, model: str) -> Dict[str, Any]:
+    # The catalog should get current counts, not an expired entry
+    return get_complaints_and_recalls(year, make, model, allow_stale=False)
+
+
+def fetch_sources(makes: List[str], years: List[int]) -> Dict[str, Stage]:
+    """
+    Run every API call the catalog needs as a pipeline: trims -> EPA options -> EPA
+    detail, with NHTSA lookups starting as soon as a trim names a model.
+
+    Each host gets its own pool of HOST_CONCURRENCY[host] workers, and each call is
+    scheduled the moment the call it depends on completes, so the stages overlap
+    instead of running one record at a time. Returns the stages by name; their
+    `results` hold every response.
+    """
+    pools = {host: ThreadPoolExecutor(max_workers=workers) for host, workers in HOST_CONCURRENCY.items()}
+    trims_stage = Stage("trims", pools["carquery"])
+    options_stage = Stage("epa_options", pools["epa"])
+    detail_stage = Stage("epa_detail", pools["epa"])
+    nhtsa_stage = Stage("nhtsa", pools["nhtsa"])
+
+    pending: Dict[Future, Tuple[Stage, Hashable]] = {}
+
+    def schedule(stage: Stage, key: Hashable, fn: Callable[..., Any], *args: Any) -> None:
+        future = stage.submit(key, fn, *args)
+        if future is not None:
+            pending[future] = (stage, key)
+
+    try:
+        for make in makes:
+            for year in years:
+                schedule(trims_stage, (make, year), get_trims, make, year)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = pending.pop(future)
+                result = future.result()
+                stage.record(key, result)
+
+                if stage is trims_stage:
+                    make, year = key
+                    for trim in (result or [])[:8]:
+                        model = trim.get("model_name")
+                        if not model:
+                            continue
+                        schedule(options_stage, (year, make, model), get_vehicle_options, year, make, model)
+                        schedule(nhtsa_stage, (year, make, model), _fresh_nhtsa, year, make, model)
+                elif stage is options_stage and result:
+                    epa_id = result[0]["id"]
+                    schedule(detail_stage, epa_id, get_vehicle_mpg, epa_id)
+    finally:
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return {stage.name: stage for stage in (trims_stage, options_stage, detail_stage, nhtsa_stage)}
+
+
 def build_catalog() -> List[Dict[str, Any]]:
     catalog: List[Dict[str, Any]] = []
     seed_specs = load_seed_specs()
 
+    stages = fetch_sources(MAKES, YEARS)
+    for stage in stages.values():
+        print(stage.report())
+    trims_by_make_year = stages["trims"].results
+    epa_options_by_model = stages["epa_options"].results
+    epa_details_by_id = stages["epa_detail"].results
+    nhtsa_by_model = stages["nhtsa"].results
+
+    # Assemble in the same make/year/trim order as the sequential sync, so ids match
     for make in MAKES:
         for year in YEARS:
-            trims = get_trims(make, year)
+            trims = trims_by_make_year.get((make, year))
             if not trims:
                 continue
 
@@ -122,11 +240,11 @@ def build_catalog() -> List[Dict[str, Any]]:
 
                 seed = seed_specs.get((make, model, year), {})
 
-                epa_options = get_vehicle_options(year, make, model)
+                epa_options = epa_options_by_model.get((year, make, model))
                 epa_id = epa_options[0]["id"] if epa_options else None
-                epa_details = get_vehicle_mpg(epa_id) if epa_id else None
+                epa_details = epa_details_by_id.get(epa_id) if epa_id else None
 
-                complaints_data = get_complaints_and_recalls(year, make, model)
+                complaints_data = nhtsa_by_model.get((year, make, model))
                 reliability = reliability_score_from_counts(
                     complaints_data.get("complaints_count", 0),
                     complaints_data.get("recalls_count", 0),
@@ -164,9 +282,22 @@ def build_catalog() -> List[Dict[str, Any]]:
 
 
 def main() -> None:
+    # A batch run can wait out NHTSA errors that the server does not retry
+    http_client.configure_host(nhtsa_issues.BASE, max_retries=http_client.DEFAULT_HOST.max_retries)
     catalog = build_catalog()
-    CACHE_FILE.write_text(json.dumps(catalog, indent=2), encoding="utf-8")
-    print(f"Wrote {len(catalog)} vehicles to {CACHE_FILE}")
+    generation = save_catalog(catalog, CACHE_FILE)
+    print(f"Wrote {len(catalog)} vehicles to {CACHE_FILE} (catalog generation {generation})")
+    cache_stats = http_cache.stats()
+    print(
+        f"HTTP cache ({cache_stats['mode']}): {cache_stats['hits']} responses served from cache, "
+        f"{cache_stats['misses']} fetched"
+    )
+    for host, host_stats in http_client.stats().items():
+        latency = host_stats["latency_ms"]
+        print(
+            f"{host}: {host_stats['requests']} requests, {host_stats['retries']} retries, "
+            f"errors {host_stats['errors']}, mean latency {latency['mean']} ms"
+        )
 
 
 if __name__ == "__main__":
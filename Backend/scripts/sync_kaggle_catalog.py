@@ -6,12 +6,16 @@ import sys
 
 import kagglehub
 
+from app.data.catalog import generation_path_for, read_generation
 from app.data.kaggle_catalog import (
     RAW_DIR,
     CACHE_FILE,
     DATASET_SLUG,
     build_kaggle_catalog,
+    iter_kaggle_chunks,
+    kaggle_records,
     write_catalog,
+    write_catalog_chunks,
 )
 
 
@@ -44,6 +48,12 @@ def main() -> int:
         default=None,
         help="Optional row limit for quick testing.",
     )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Stream the CSV this many rows at a time, keeping memory flat for large datasets.",
+    )
     args = parser.parse_args()
 
     try:
@@ -55,14 +65,25 @@ def main() -> int:
         return 1
 
     print(f"[INFO] Using dataset at: {csv_path}")
-    cars = build_kaggle_catalog(csv_path, limit=args.limit)
+    if args.chunk_size:
+        seen_ids = set()
+        chunks = (
+            kaggle_records(chunk, seen_ids)
+            for chunk in iter_kaggle_chunks(csv_path, args.chunk_size, limit=args.limit)
+        )
+        written = write_catalog_chunks(chunks, CACHE_FILE)
+    else:
+        cars = build_kaggle_catalog(csv_path, limit=args.limit)
+        written = len(cars)
+        if cars:
+            write_catalog(cars, CACHE_FILE)
 
-    if not cars:
+    if not written:
         print("[WARN] No records found to write.")
         return 1
 
-    write_catalog(cars, CACHE_FILE)
-    print(f"[SUCCESS] Wrote {len(cars)} vehicles to {CACHE_FILE}")
+    generation = read_generation(generation_path_for(CACHE_FILE))
+    print(f"[SUCCESS] Wrote {written} vehicles to {CACHE_FILE} (catalog generation {generation})")
     return 0
 
 